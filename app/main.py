@@ -1,9 +1,12 @@
+import asyncio
 import logging
+import re
 import sys
 from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Dict, List
+import orjson
 import uvicorn
 
 # Add src to Python path
@@ -11,7 +14,7 @@ sys.path.append(str(Path(__file__).parent.parent / "src"))
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 
 from src.models.schemas import (
     UserInput,
@@ -30,6 +33,33 @@ from config.settings import API_PORT, LOG_LEVEL, LOG_FORMAT
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+# Patterns used by the markdown/MedEx helpers, compiled once at import
+_H2_RE = re.compile(r'^## (.+)$', re.MULTILINE)
+_H3_RE = re.compile(r'^### (.+)$', re.MULTILINE)
+_DOT_BULLET_RE = re.compile(r'^• (.+)$', re.MULTILINE)
+_DASH_BULLET_RE = re.compile(r'^- (.+)$', re.MULTILINE)
+_LIST_BLOCK_RE = re.compile(r'(<li>.*</li>(?:\s*<li>.*</li>)*)', re.DOTALL)
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+_ITALIC_RE = re.compile(r'\*(.+?)\*')
+_WRAPPED_HEADER_RE = re.compile(r'<p>(<h[1-6]>.*</h[1-6]>)</p>')
+_WRAPPED_LIST_RE = re.compile(r'<p>(<ul>.*</ul>)</p>', re.DOTALL)
+_WRAPPED_TABLE_RE = re.compile(r'<p>(<table.*</table>)</p>', re.DOTALL)
+
+_INTERACTION_KEYWORDS = [
+    "drug interaction",
+    "contraindicated",
+    "caution",
+    "avoid",
+    "concurrent use",
+    "may increase",
+    "may decrease",
+]
+# Matches a whole line containing any keyword, so a page is scanned in one pass
+_INTERACTION_LINE_RE = re.compile(
+    r"^.*?(?:" + "|".join(map(re.escape, _INTERACTION_KEYWORDS)) + r").*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
 # Global service instances
 drug_lookup = None
 jina_scraper = None
@@ -69,6 +99,8 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down Medical Advisor API...")
+    if jina_scraper:
+        jina_scraper.close()
 
 
 # Initialize FastAPI app
@@ -208,144 +240,179 @@ async def get_drug_info(drug_name: str):
         )
 
 
-@app.post("/advise", response_model=dict)
-async def get_medication_advice(user_input: UserInput):
-    """Generate medication advice based on user input.
+async def _prepare_advice(user_input: UserInput) -> Dict:
+    """Gather everything the advice prompt needs for a request.
 
     Args:
         user_input: User input containing medications, schedule, age, and gender
-    """
-    try:
-        logger.info(f"Processing advice request for {len(user_input.meds)} medications")
-
-        # Validate input
-        if len(user_input.meds) != len(user_input.schedule):
-            raise HTTPException(
-                status_code=400,
-                detail="Number of medications must match number of schedules",
-            )
-
-        # Check service availability
-        if not all(
-            [drug_lookup, jina_scraper, vector_search, gemini_client, knowledge_graph]
-        ):
-            raise HTTPException(
-                status_code=503,
-                detail="One or more required services are not available",
-            )
 
-        # Enhanced medication processing with interaction analysis
-        medications = []
-        medex_contexts = []
-        interaction_warnings = []
-        successful_scrapes = 0
-
-        logger.info("Step 1/4: Processing medications and scraping drug information...")
-        for i, (med_name, schedule) in enumerate(
-            zip(user_input.meds, user_input.schedule)
-        ):
-            logger.info(
-                f"Processing medication {i + 1}/{len(user_input.meds)}: {med_name}"
-            )
-
-            # Lookup drug URL
-            url = drug_lookup.find_drug_url(med_name)
-            medex_data = None
-
-            # Scrape MedEx data if URL found
-            if url:
-                logger.info(f"Scraping drug information for {med_name}...")
-                medex_data = jina_scraper.scrape_medex_page(url)
-                if medex_data:
-                    medex_contexts.append(medex_data)
-                    successful_scrapes += 1
-                    # Extract interaction information
-                    interactions = extract_interaction_info(medex_data)
-                    if interactions:
-                        interaction_warnings.extend(interactions)
-
-            medications.append(
-                MedicationInfo(
-                    name=med_name, url=url, medex_data=medex_data, schedule=schedule
-                )
-            )
+    Returns:
+        Medications, patient info, literature and MedEx context, plus the
+        counts reported alongside the advice
+    """
+    # Validate input
+    if len(user_input.meds) != len(user_input.schedule):
+        raise HTTPException(
+            status_code=400,
+            detail="Number of medications must match number of schedules",
+        )
 
-        logger.info("Step 2/4: Analyzing drug-drug interactions...")
-        # Analyze drug-drug interactions using knowledge graph
-        drug_interactions = knowledge_graph.analyze_drug_interactions(user_input.meds)
+    # Check service availability
+    if not all(
+        [drug_lookup, jina_scraper, vector_search, gemini_client, knowledge_graph]
+    ):
+        raise HTTPException(
+            status_code=503,
+            detail="One or more required services are not available",
+        )
 
-        logger.info("Step 3/4: Searching for relevant medical literature...")
-        # Enhanced context search including interactions and combination therapy
-        medication_query = " ".join(user_input.meds)
-        
-        # Create comprehensive search query for combination therapy
-        if len(user_input.meds) > 1:
-            combination_query = f"{medication_query} combination therapy drug interactions polypharmacy"
-        else:
-            combination_query = f"{medication_query} monotherapy safety monitoring"
-        
-        pubmed_context = vector_search.enhanced_medical_search(
+    # Enhanced medication processing with interaction analysis
+    medications = []
+    medex_contexts = []
+    interaction_warnings = []
+    successful_scrapes = 0
+
+    logger.info("Step 1/4: Looking up medications in the drug database...")
+    # Lookup drug URLs
+    drug_urls = [drug_lookup.find_drug_url(med_name) for med_name in user_input.meds]
+
+    # Create comprehensive search query for combination therapy
+    medication_query = " ".join(user_input.meds)
+    if len(user_input.meds) > 1:
+        combination_query = f"{medication_query} combination therapy drug interactions polypharmacy"
+    else:
+        combination_query = f"{medication_query} monotherapy safety monitoring"
+
+    logger.info("Step 2/4: Analyzing drug-drug interactions...")
+    # Analyze drug-drug interactions using knowledge graph
+    drug_interactions = knowledge_graph.analyze_drug_interactions(user_input.meds)
+
+    logger.info(
+        "Step 3/4: Scraping drug information and searching medical literature..."
+    )
+    # Scraping is network-bound and the literature search is model-bound;
+    # neither needs the other's output, so run them side by side
+    scraped_pages, pubmed_context = await asyncio.gather(
+        jina_scraper.batch_scrape_async([url for url in drug_urls if url], delay=0),
+        asyncio.to_thread(
+            vector_search.enhanced_medical_search,
             query=combination_query,
             medications=user_input.meds,
             patient_info={"age": user_input.age, "gender": user_input.gender.value},
             k=5,
+        ),
+    )
+
+    for med_name, schedule, url in zip(
+        user_input.meds, user_input.schedule, drug_urls
+    ):
+        medex_data = scraped_pages.get(url) if url else None
+        if medex_data:
+            medex_contexts.append(medex_data)
+            successful_scrapes += 1
+            # Extract interaction information
+            interactions = extract_interaction_info(medex_data)
+            if interactions:
+                interaction_warnings.extend(interactions)
+
+        medications.append(
+            MedicationInfo(
+                name=med_name, url=url, medex_data=medex_data, schedule=schedule
+            )
         )
 
-        logger.info("Step 4/4: Generating integrated medication regimen guidance...")
-        # Generate advice with comprehensive combination analysis
-        patient_info = {
-            "age": user_input.age,
-            "gender": user_input.gender.value,
-            "drug_interactions": drug_interactions,
-            "interaction_warnings": interaction_warnings,
-            "medication_count": len(medications),
-            "regimen_type": "combination_therapy" if len(medications) > 1 else "monotherapy"
-        }
+    logger.info("Step 4/4: Generating integrated medication regimen guidance...")
+    # Generate advice with comprehensive combination analysis
+    patient_info = {
+        "age": user_input.age,
+        "gender": user_input.gender.value,
+        "drug_interactions": drug_interactions,
+        "interaction_warnings": interaction_warnings,
+        "medication_count": len(medications),
+        "regimen_type": "combination_therapy" if len(medications) > 1 else "monotherapy"
+    }
+
+    return {
+        "medications": medications,
+        "patient_info": patient_info,
+        "pubmed_context": pubmed_context,
+        "medex_context": medex_contexts,
+        "drug_interactions": drug_interactions,
+        "interaction_warnings": interaction_warnings,
+        "successful_scrapes": successful_scrapes,
+    }
+
+
+def _advice_details(user_input: UserInput, prepared: Dict) -> Dict:
+    """Response fields that accompany the advice text."""
+    medications = prepared["medications"]
+    pubmed_context = prepared["pubmed_context"]
+    drug_interactions = prepared["drug_interactions"]
+
+    return {
+        "medications_processed": len(medications),
+        "medications_found": len([m for m in medications if m.url]),
+        "successful_scrapes": prepared["successful_scrapes"],
+        "pubmed_articles": len(pubmed_context),
+        "context_sources": [
+            {
+                "title": doc.get("title", f"Medical Research Article {i+1}"),
+                "source": doc.get("source", "Medical Literature"),
+                "url": doc.get("url", "#"),
+                "section_type": doc.get("section_type", "general"),
+                "publication_year": doc.get("publication_year", ""),
+            }
+            for i, doc in enumerate(pubmed_context[:5])
+        ],
+        "drug_interactions_found": len(drug_interactions)
+        if drug_interactions
+        else 0,
+        "interaction_warnings": len(prepared["interaction_warnings"]),
+        "processing_time": "Generated successfully",
+        "patient_age": user_input.age,
+        "patient_gender": user_input.gender.value,
+        "medications_detail": [
+            {
+                "name": med.name,
+                "schedule": med.schedule,
+                "found_in_database": med.url is not None,
+                "has_detailed_info": med.medex_data is not None,
+            }
+            for med in medications
+        ],
+        "advice_format": "structured_with_table",
+    }
+
+
+def _advice_prompt_args(prepared: Dict) -> Dict:
+    """Keyword arguments for GeminiClient's advice methods."""
+    return {
+        "medications": [med.dict() for med in prepared["medications"]],
+        "patient_info": prepared["patient_info"],
+        "pubmed_context": prepared["pubmed_context"],
+        "medex_context": prepared["medex_context"],
+    }
+
+
+@app.post("/advise", response_model=dict)
+async def get_medication_advice(user_input: UserInput):
+    """Generate medication advice based on user input.
+
+    Args:
+        user_input: User input containing medications, schedule, age, and gender
+    """
+    try:
+        logger.info(f"Processing advice request for {len(user_input.meds)} medications")
 
-        advice = gemini_client.generate_advice(
-            medications=[med.dict() for med in medications],
-            patient_info=patient_info,
-            pubmed_context=pubmed_context,
-            medex_context=medex_contexts,
+        prepared = await _prepare_advice(user_input)
+        advice = await gemini_client.generate_advice_async(
+            **_advice_prompt_args(prepared)
         )
 
         # Prepare enhanced response with more detailed information
-        response_data = {
-            "advice": advice,
-            "medications_processed": len(medications),
-            "medications_found": len([m for m in medications if m.url]),
-            "successful_scrapes": successful_scrapes,
-            "pubmed_articles": len(pubmed_context),
-            "context_sources": [
-                {
-                    "title": doc.get("title", f"Medical Research Article {i+1}"),
-                    "source": doc.get("source", "Medical Literature"),
-                    "url": doc.get("url", "#"),
-                    "section_type": doc.get("section_type", "general"),
-                    "publication_year": doc.get("publication_year", ""),
-                }
-                for i, doc in enumerate(pubmed_context[:5])
-            ],
-            "drug_interactions_found": len(drug_interactions)
-            if drug_interactions
-            else 0,
-            "interaction_warnings": len(interaction_warnings),
-            "processing_time": "Generated successfully",
-            "patient_age": user_input.age,
-            "patient_gender": user_input.gender.value,
-            "medications_detail": [
-                {
-                    "name": med.name,
-                    "schedule": med.schedule,
-                    "found_in_database": med.url is not None,
-                    "has_detailed_info": med.medex_data is not None,
-                }
-                for med in medications
-            ],
-            "advice_format": "structured_with_table",
-        }
+        response_data = {"advice": advice, **_advice_details(user_input, prepared)}
 
-        logger.info(f"Successfully generated integrated regimen guidance for {len(medications)} medications")
+        logger.info(f"Successfully generated integrated regimen guidance for {len(prepared['medications'])} medications")
         return response_data
 
     except HTTPException:
@@ -358,6 +425,48 @@ async def get_medication_advice(user_input: UserInput):
         )
 
 
+@app.post("/advise/stream")
+async def stream_medication_advice(user_input: UserInput):
+    """Stream medication advice as newline-delimited JSON.
+
+    The first line holds the same details as /advise except the advice text
+    (``{"details": {...}}``); each following line carries the next piece of
+    advice text as it is generated (``{"delta": "..."}``). The last line is
+    ``{"done": true}`` once the advice is complete, or ``{"error": "..."}`` if
+    generation failed part-way; a stream without either was cut short.
+
+    Args:
+        user_input: User input containing medications, schedule, age, and gender
+    """
+    try:
+        logger.info(f"Streaming advice request for {len(user_input.meds)} medications")
+        prepared = await _prepare_advice(user_input)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating advice: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while generating medication advice",
+        )
+
+    async def advice_lines():
+        yield orjson.dumps({"details": _advice_details(user_input, prepared)}) + b"\n"
+        try:
+            async for chunk in gemini_client.stream_advice(
+                **_advice_prompt_args(prepared)
+            ):
+                yield orjson.dumps({"delta": chunk}) + b"\n"
+        except Exception as e:
+            logger.error(f"Error streaming advice: {e}", exc_info=True)
+            yield orjson.dumps({"error": "Advice generation was interrupted"}) + b"\n"
+            return
+        yield orjson.dumps({"done": True}) + b"\n"
+
+    return StreamingResponse(advice_lines(), media_type="application/x-ndjson")
+
+
 @app.post("/advise/html")
 async def get_medication_advice_html(user_input: UserInput):
     """Generate medication advice with HTML table formatting.
@@ -538,23 +647,20 @@ def convert_markdown_to_html(markdown_text: str) -> str:
     """
     
     # Convert markdown to HTML (basic conversion)
-    import re
-    from datetime import datetime
-    
     # Convert headers
-    content = re.sub(r'^## (.+)$', r'<h2>\1</h2>', markdown_text, flags=re.MULTILINE)
-    content = re.sub(r'^### (.+)$', r'<h3>\1</h3>', content, flags=re.MULTILINE)
+    content = _H2_RE.sub(r'<h2>\1</h2>', markdown_text)
+    content = _H3_RE.sub(r'<h3>\1</h3>', content)
     
     # Convert bullet points
-    content = re.sub(r'^• (.+)$', r'<li>\1</li>', content, flags=re.MULTILINE)
-    content = re.sub(r'^- (.+)$', r'<li>\1</li>', content, flags=re.MULTILINE)
+    content = _DOT_BULLET_RE.sub(r'<li>\1</li>', content)
+    content = _DASH_BULLET_RE.sub(r'<li>\1</li>', content)
     
     # Wrap consecutive list items in <ul> tags
-    content = re.sub(r'(<li>.*</li>(?:\s*<li>.*</li>)*)', r'<ul>\1</ul>', content, flags=re.DOTALL)
+    content = _LIST_BLOCK_RE.sub(r'<ul>\1</ul>', content)
     
     # Convert bold text
-    content = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', content)
-    content = re.sub(r'\*(.+?)\*', r'<em>\1</em>', content)
+    content = _BOLD_RE.sub(r'<strong>\1</strong>', content)
+    content = _ITALIC_RE.sub(r'<em>\1</em>', content)
     
     # Convert paragraphs
     paragraphs = content.split('\n\n')
@@ -598,9 +704,9 @@ def convert_markdown_to_html(markdown_text: str) -> str:
     content = '\n'.join(formatted_paragraphs)
     
     # Clean up extra paragraph tags around headers and lists
-    content = re.sub(r'<p>(<h[1-6]>.*</h[1-6]>)</p>', r'\1', content)
-    content = re.sub(r'<p>(<ul>.*</ul>)</p>', r'\1', content, flags=re.DOTALL)
-    content = re.sub(r'<p>(<table.*</table>)</p>', r'\1', content, flags=re.DOTALL)
+    content = _WRAPPED_HEADER_RE.sub(r'\1', content)
+    content = _WRAPPED_LIST_RE.sub(r'\1', content)
+    content = _WRAPPED_TABLE_RE.sub(r'\1', content)
     
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
@@ -609,26 +715,8 @@ def convert_markdown_to_html(markdown_text: str) -> str:
 
 def extract_interaction_info(medex_data: str) -> List[str]:
     """Extract drug interaction information from MedEx data."""
-    interactions = []
-
     # Simple keyword-based extraction - in practice, this would be more sophisticated
-    interaction_keywords = [
-        "drug interaction",
-        "contraindicated",
-        "caution",
-        "avoid",
-        "concurrent use",
-        "may increase",
-        "may decrease",
-    ]
-
-    lines = medex_data.split("\n")
-    for line in lines:
-        line_lower = line.lower()
-        if any(keyword in line_lower for keyword in interaction_keywords):
-            interactions.append(line.strip())
-
-    return interactions
+    return [match.group(0).strip() for match in _INTERACTION_LINE_RE.finditer(medex_data)]
 
 
 @app.get("/stats")
@@ -16,6 +16,7 @@ JINA_API_KEY = os.getenv("JINA_API_KEY")
 MAX_MEDICATIONS = 10
 DEFAULT_SEARCH_RESULTS = 5
 CACHE_EXPIRY_HOURS = 24
+ADVICE_CACHE_MAX_ENTRIES = 256
 API_PORT = 8000
 UI_PORT = 8501
 
@@ -28,14 +29,43 @@ RAW_DATA_DIR = DATA_DIR / "raw"
 
 # Vector Search Settings
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
 VECTOR_SEARCH_TOP_K = 5
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+EMBEDDING_BATCH_SIZE = 128
+EMBEDDING_GPU_BATCH_SIZE = 1024
+INDEX_BUILD_CHUNK_SIZE = 16384
+DATA_LOAD_WORKERS = min(16, os.cpu_count() or 1)
 FAISS_INDEX_PATH = DATA_DIR / "vector_index.faiss"
 DOCUMENTS_METADATA_PATH = DATA_DIR / "documents_metadata.json"
+DOCUMENTS_PARQUET_PATH = DATA_DIR / "documents_metadata.parquet"
+EMBEDDINGS_PATH = DATA_DIR / "document_embeddings.npy"
+EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache.npz"
+HNSW_MIN_DOCUMENTS = 1000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Knowledge Graph Settings
+# Compiled graph arrays; np.load reads .npz members eagerly, which is fine for
+# arrays this small
+ONTOLOGY_ARTIFACT_PATH = DATA_DIR / "ontology.npz"
+
+# Text Processing Settings
+SPACY_MODEL = "en_core_web_sm"
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "64"))
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", "-1"))
+CLEAN_TEXT_CACHE_SIZE = 8192
+CLEAN_TEXT_CACHE_MAX_CHARS = 4096
+MEDICATION_NAME_CACHE_SIZE = 4096
 
 # Scraping Settings
 JINA_BASE_URL = "https://r.jina.ai/"
 REQUEST_TIMEOUT = 30
 SCRAPING_DELAY = 1.0
+JINA_MAX_CONCURRENCY = 5
+MEDEX_MAX_CONTENT_CHARS = 64 * 1024
+MEDEX_STREAM_CHUNK_SIZE = 8192
 
 # Logging Configuration
 LOG_LEVEL = "INFO"
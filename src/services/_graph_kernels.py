@@ -0,0 +1,80 @@
+"""Compiled traversal kernels over the knowledge graph's CSR arrays."""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+except ImportError:
+    logger.warning("numba not installed. Graph traversal will run uncompiled.")
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
+UNREACHABLE = 255
+
+
+@njit("int32(int32[::1], int32[::1], int32, int32, int32[::1])", cache=True)
+def bfs_within(indptr, indices, src, depth, out):
+    """Write ids reachable from src within depth hops into out, in BFS order.
+
+    Returns:
+        Number of ids written
+    """
+    n = indptr.shape[0] - 1
+    distance = np.full(n, -1, np.int32)
+    distance[src] = 0
+    queue = np.empty(n, np.int32)
+    queue[0] = src
+    head = 0
+    tail = 1
+    count = 0
+
+    while head < tail:
+        node = queue[head]
+        head += 1
+        if distance[node] >= depth:
+            continue
+        for k in range(indptr[node], indptr[node + 1]):
+            neighbor = indices[k]
+            if distance[neighbor] < 0:
+                distance[neighbor] = distance[node] + 1
+                queue[tail] = neighbor
+                tail += 1
+                out[count] = neighbor
+                count += 1
+
+    return count
+
+
+@njit("void(int32[::1], int32[::1], uint8[:, ::1])", cache=True)
+def all_pairs_shortest_paths(indptr, indices, dist):
+    """Fill dist with unweighted hop counts via one BFS per source.
+
+    Unreachable pairs keep their initial value (UNREACHABLE); distances
+    saturate at UNREACHABLE - 1, which only matters past 254 hops.
+    """
+    n = indptr.shape[0] - 1
+    queue = np.empty(n, np.int32)
+
+    for src in range(n):
+        row = dist[src]
+        row[src] = 0
+        queue[0] = src
+        head = 0
+        tail = 1
+
+        while head < tail:
+            node = queue[head]
+            head += 1
+            hops = min(row[node] + 1, UNREACHABLE - 1)
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[k]
+                if row[neighbor] == UNREACHABLE:
+                    row[neighbor] = hops
+                    queue[tail] = neighbor
+                    tail += 1
@@ -0,0 +1,86 @@
+"""Compiled relevance scoring over the documents' term-id CSR arrays."""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+except ImportError:
+    logger.warning("numba not installed. Relevance scoring will run uncompiled.")
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
+@njit("int64(int64[::1], int32[::1], int64, int32[::1])", cache=True)
+def count_terms(indptr, indices, row, term_ids):
+    """Count how many of term_ids occur in one row; row ids must be sorted."""
+    start = indptr[row]
+    stop = indptr[row + 1]
+    count = 0
+
+    for term in term_ids:
+        lo = start
+        hi = stop
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if indices[mid] < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < stop and indices[lo] == term:
+            count += 1
+
+    return count
+
+
+@njit(
+    "float64[::1](float32[::1], int64[::1], int64[::1], int32[::1], int64[::1],"
+    " int32[::1], int32[::1], int64, float64[::1], float64[::1], float64[::1])",
+    cache=True,
+)
+def medical_relevance(
+    scores,
+    doc_ids,
+    content_indptr,
+    content_indices,
+    mesh_indptr,
+    mesh_indices,
+    term_ids,
+    num_query_terms,
+    priority_bonus,
+    recency_bonus,
+    temporal_weight,
+):
+    """Combine similarity scores with term overlap and per-document bonuses.
+
+    num_query_terms counts every query term, including those missing from
+    the vocabulary and therefore from term_ids.
+    """
+    relevance = np.empty(doc_ids.shape[0])
+
+    for i in range(doc_ids.shape[0]):
+        doc = doc_ids[i]
+        term_overlap = 0.0
+        mesh_overlap = 0.0
+        if num_query_terms > 0:
+            term_overlap = (
+                count_terms(content_indptr, content_indices, doc, term_ids)
+                / num_query_terms
+            )
+            mesh_overlap = (
+                count_terms(mesh_indptr, mesh_indices, doc, term_ids) / num_query_terms
+            )
+
+        relevance[i] = (
+            np.float64(scores[i])
+            + term_overlap * 0.2
+            + mesh_overlap * 0.3
+            + priority_bonus[doc]
+            + recency_bonus[doc]
+        ) * temporal_weight[doc]
+
+    return relevance
@@ -1,16 +1,136 @@
+import hashlib
 import logging
-from typing import List, Dict
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import google.generativeai as genai
-from config.settings import GEMINI_API_KEY, GEMINI_MODEL_NAME
+from config.settings import (
+    GEMINI_API_KEY,
+    GEMINI_MODEL_NAME,
+    CACHE_EXPIRY_HOURS,
+    ADVICE_CACHE_MAX_ENTRIES,
+)
 
 logger = logging.getLogger(__name__)
 
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+# Static prompt skeletons, filled with str.format_map per request
+_PROMPT_TEMPLATE = """You are an expert clinical pharmacist providing evidence-based medication guidance for a complete medication regimen.
+
+**CRITICAL FORMATTING INSTRUCTIONS:**
+- Use ONLY standard markdown formatting - headers (##), bullet points (-), and tables
+- Start each section with proper markdown headers (##)
+- For MEDICATION REGIMEN ANALYSIS section: Use EXACTLY 3 bullet points (-)
+- Each bullet point must be under 20 words
+- Focus only on: therapeutic purpose, key interactions, timing benefits
+- Add blank line after MEDICATION REGIMEN ANALYSIS section before next section
+- Use professional medical language without conversational phrases
+- Do NOT use phrases like "Okay, here's..." or "Let me provide..."
+- For tables, use simple markdown table format with pipe separators (|)
+- DO'S AND DON'TS table format:
+
+| DON'T | DO |
+|-------|-----|
+| Don't abruptly stop medications | Take medications at consistent times daily |
+| Don't skip doses without consulting doctor | Follow prescribed dosage schedule exactly |
+| Don't take with alcohol | Take with plenty of water |
+| Don't ignore side effects | Report unusual symptoms immediately |
+
+**CONTENT INSTRUCTIONS:**
+- Analyze ALL medications as a COMBINED REGIMEN, not individually
+- Focus on synergistic effects, drug interactions, and overall therapeutic strategy
+- Provide unified timing recommendations and lifestyle modifications
+- Address the patient's complete treatment plan holistically
+
+**PATIENT PROFILE:**
+- Age: {age} years
+- Gender: {gender}
+- Medication Risk Level: {risk_level}
+
+**COMPLETE MEDICATION REGIMEN:**
+{med_list}
+
+**MEDICATION COMBINATION ANALYSIS:**
+{combination_context}
+
+**CLINICAL EVIDENCE BASE:**
+{prioritized_context}
+
+**RISK ASSESSMENT:**
+{risk_summary}
+
+**REQUIRED RESPONSE FORMAT:**
+## MEDICATION REGIMEN ANALYSIS
+- [First bullet: therapeutic purpose/indication - max 20 words]
+- [Second bullet: key interaction or safety concern - max 20 words]  
+- [Third bullet: timing/administration benefit - max 20 words]
+
+## THERAPEUTIC INDICATIONS & RATIONALE
+
+## INTEGRATED DOSING STRATEGY
+### Timing Coordination
+### Administration Guidelines
+
+## SAFETY MONITORING PROTOCOL
+### Key Parameters to Monitor
+### Warning Signs
+
+## DRUG INTERACTION MANAGEMENT
+### Identified Interactions
+### Mitigation Strategies
+
+## DO'S AND DON'TS REFERENCE TABLE
+
+| DON'T | DO |
+|-------|-----|
+| [Specific action to avoid] | [Specific action to take] |
+| [Specific action to avoid] | [Specific action to take] |
+| [Specific action to avoid] | [Specific action to take] |
+| [Specific action to avoid] | [Specific action to take] |
+
+## LIFESTYLE & DIETARY CONSIDERATIONS
+### Coordinated Recommendations
+### Timing with Meals
+
+Provide a comprehensive, professional medication management plan that addresses this specific combination of medications. Focus on integration, not individual drug analysis."""
+
+_COMBINATION_TEMPLATE = """**REGIMEN OVERVIEW:**
+- Total medications: {medication_count}
+- Medication names: {medication_names}
+- Dosing schedules: {schedules}
+
+**THERAPEUTIC CATEGORY ANALYSIS:**
+{therapeutic_analysis}
+
+**TIMING COORDINATION:**
+{timing_analysis}
+
+**INTERACTION ASSESSMENT:**
+{interaction_analysis}"""
+
+_ARTICLE_TEMPLATE = """**Article {number}:**
+Title: {title}
+Content: {content}...
+Relevance Score: {relevance:.3f}"""
+
+_MEDEX_CONTEXT_CHARS = 1000
+
+_HIGH_RISK_MEDS = ("warfarin", "insulin", "digoxin", "lithium")
+_MODERATE_RISK_MEDS = ("metformin", "lisinopril", "atorvastatin")
+
 
 class GeminiClient:
     def __init__(self):
         self.api_key = GEMINI_API_KEY
         self.model_name = GEMINI_MODEL_NAME
         self.model = None
+        self._advice_cache: "OrderedDict[str, tuple]" = OrderedDict()
         self._initialize_client()
 
     def _initialize_client(self):
@@ -46,26 +166,138 @@ class GeminiClient:
                 medications, patient_info, pubmed_context, medex_context
             )
 
+            cache_key = self._cache_key(prompt)
+            cached = self._get_cached_advice(cache_key)
+            if cached:
+                return cached
+
             response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.3,
-                    "top_p": 0.8,
-                    "top_k": 40,
-                    "max_output_tokens": 2048,
-                },
+                prompt, generation_config=GENERATION_CONFIG
             )
+            return self._handle_response(cache_key, response)
 
-            if response.text:
-                return response.text
-            else:
-                logger.warning("Empty response from Gemini")
-                return self._fallback_advice()
+        except Exception as e:
+            logger.error(f"Error generating advice with Gemini: {e}")
+            return self._fallback_advice()
+
+    async def generate_advice_async(
+        self,
+        medications: List[Dict],
+        patient_info: Dict,
+        pubmed_context: List[Dict],
+        medex_context: List[str],
+    ) -> str:
+        """Async variant of generate_advice that does not block the event loop."""
+        if not self.model:
+            return self._fallback_advice()
+
+        try:
+            prompt = self._build_structured_prompt(
+                medications, patient_info, pubmed_context, medex_context
+            )
+
+            cache_key = self._cache_key(prompt)
+            cached = self._get_cached_advice(cache_key)
+            if cached:
+                return cached
+
+            response = await self.model.generate_content_async(
+                prompt, generation_config=GENERATION_CONFIG
+            )
+            return self._handle_response(cache_key, response)
 
         except Exception as e:
             logger.error(f"Error generating advice with Gemini: {e}")
             return self._fallback_advice()
 
+    async def stream_advice(
+        self,
+        medications: List[Dict],
+        patient_info: Dict,
+        pubmed_context: List[Dict],
+        medex_context: List[str],
+    ) -> AsyncIterator[str]:
+        """Yield advice text chunks as Gemini decodes them.
+
+        Failures before the first chunk yield the fallback advice instead.
+        A failure after text has been yielded is re-raised, since the advice
+        so far is incomplete and must not pass for a full answer.
+        """
+        if not self.model:
+            yield self._fallback_advice()
+            return
+
+        try:
+            prompt = self._build_structured_prompt(
+                medications, patient_info, pubmed_context, medex_context
+            )
+        except Exception as e:
+            logger.error(f"Error generating advice with Gemini: {e}")
+            yield self._fallback_advice()
+            return
+
+        cache_key = self._cache_key(prompt)
+        cached = self._get_cached_advice(cache_key)
+        if cached:
+            yield cached
+            return
+
+        chunks = []
+        try:
+            response = await self.model.generate_content_async(
+                prompt, generation_config=GENERATION_CONFIG, stream=True
+            )
+            async for chunk in response:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Error generating advice with Gemini: {e}")
+            # Partial output is never cached
+            if chunks:
+                raise
+            yield self._fallback_advice()
+            return
+
+        if chunks:
+            self._store_advice(cache_key, "".join(chunks))
+        else:
+            logger.warning("Empty response from Gemini")
+            yield self._fallback_advice()
+
+    def _handle_response(self, cache_key: str, response) -> str:
+        """Return response text, caching it, or fall back on empty output."""
+        if response.text:
+            self._store_advice(cache_key, response.text)
+            return response.text
+        else:
+            logger.warning("Empty response from Gemini")
+            return self._fallback_advice()
+
+    def _cache_key(self, prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _get_cached_advice(self, cache_key: str) -> Optional[str]:
+        """Return cached advice for an identical prompt if it has not expired."""
+        entry = self._advice_cache.get(cache_key)
+        if not entry:
+            return None
+
+        created_at, advice = entry
+        if time.monotonic() - created_at > CACHE_EXPIRY_HOURS * 3600:
+            del self._advice_cache[cache_key]
+            return None
+
+        self._advice_cache.move_to_end(cache_key)
+        logger.info("Serving advice from cache")
+        return advice
+
+    def _store_advice(self, cache_key: str, advice: str) -> None:
+        self._advice_cache[cache_key] = (time.monotonic(), advice)
+        self._advice_cache.move_to_end(cache_key)
+        while len(self._advice_cache) > ADVICE_CACHE_MAX_ENTRIES:
+            self._advice_cache.popitem(last=False)
+
     def _build_structured_prompt(
         self,
         medications: List[Dict],
@@ -74,8 +306,11 @@ class GeminiClient:
         medex_context: List[str],
     ) -> str:
         """Build prompt for structured output."""
+        # Lowercase each name once and share it across the analyzer helpers
+        tokenized_meds = [(med, med.get("name", "").lower()) for med in medications]
+
         # Analyze medication risk profile
-        risk_analysis = self._analyze_medication_risks(medications, patient_info)
+        risk_analysis = self._analyze_medication_risks(tokenized_meds, patient_info)
 
         # Prioritize context based on risk level
         prioritized_context = self._prioritize_medical_context(
@@ -92,131 +327,62 @@ class GeminiClient:
 
         # Generate medication combination context
         combination_context = self._generate_combination_context(
-            medications, patient_info
+            tokenized_meds, patient_info
         )
 
         # Gender mapping for better readability
         gender_map = {"M": "Male", "F": "Female", "O": "Other"}
         gender_display = gender_map.get(patient_info.get("gender", "O"), "Other")
 
-        prompt = f"""You are an expert clinical pharmacist providing evidence-based medication guidance for a complete medication regimen.
-
-**CRITICAL FORMATTING INSTRUCTIONS:**
-- Use ONLY standard markdown formatting - headers (##), bullet points (-), and tables
-- Start each section with proper markdown headers (##)
-- For MEDICATION REGIMEN ANALYSIS section: Use EXACTLY 3 bullet points (-)
-- Each bullet point must be under 20 words
-- Focus only on: therapeutic purpose, key interactions, timing benefits
-- Add blank line after MEDICATION REGIMEN ANALYSIS section before next section
-- Use professional medical language without conversational phrases
-- Do NOT use phrases like "Okay, here's..." or "Let me provide..."
-- For tables, use simple markdown table format with pipe separators (|)
-- DO'S AND DON'TS table format:
-
-| DON'T | DO |
-|-------|-----|
-| Don't abruptly stop medications | Take medications at consistent times daily |
-| Don't skip doses without consulting doctor | Follow prescribed dosage schedule exactly |
-| Don't take with alcohol | Take with plenty of water |
-| Don't ignore side effects | Report unusual symptoms immediately |
-
-**CONTENT INSTRUCTIONS:**
-- Analyze ALL medications as a COMBINED REGIMEN, not individually
-- Focus on synergistic effects, drug interactions, and overall therapeutic strategy
-- Provide unified timing recommendations and lifestyle modifications
-- Address the patient's complete treatment plan holistically
-
-**PATIENT PROFILE:**
-- Age: {patient_info.get("age", "Not specified")} years
-- Gender: {gender_display}
-- Medication Risk Level: {risk_analysis["level"]}
-
-**COMPLETE MEDICATION REGIMEN:**
-{chr(10).join(med_list)}
-
-**MEDICATION COMBINATION ANALYSIS:**
-{combination_context}
-
-**CLINICAL EVIDENCE BASE:**
-{prioritized_context}
-
-**RISK ASSESSMENT:**
-{risk_analysis["summary"]}
-
-**REQUIRED RESPONSE FORMAT:**
-## MEDICATION REGIMEN ANALYSIS
-- [First bullet: therapeutic purpose/indication - max 20 words]
-- [Second bullet: key interaction or safety concern - max 20 words]  
-- [Third bullet: timing/administration benefit - max 20 words]
-
-## THERAPEUTIC INDICATIONS & RATIONALE
-
-## INTEGRATED DOSING STRATEGY
-### Timing Coordination
-### Administration Guidelines
-
-## SAFETY MONITORING PROTOCOL
-### Key Parameters to Monitor
-### Warning Signs
-
-## DRUG INTERACTION MANAGEMENT
-### Identified Interactions
-### Mitigation Strategies
-
-## DO'S AND DON'TS REFERENCE TABLE
-
-| DON'T | DO |
-|-------|-----|
-| [Specific action to avoid] | [Specific action to take] |
-| [Specific action to avoid] | [Specific action to take] |
-| [Specific action to avoid] | [Specific action to take] |
-| [Specific action to avoid] | [Specific action to take] |
-
-## LIFESTYLE & DIETARY CONSIDERATIONS
-### Coordinated Recommendations
-### Timing with Meals
-
-Provide a comprehensive, professional medication management plan that addresses this specific combination of medications. Focus on integration, not individual drug analysis."""
-
-        return prompt
+        return _PROMPT_TEMPLATE.format_map(
+            {
+                "age": patient_info.get("age", "Not specified"),
+                "gender": gender_display,
+                "risk_level": risk_analysis["level"],
+                "med_list": "\n".join(med_list),
+                "combination_context": combination_context,
+                "prioritized_context": prioritized_context,
+                "risk_summary": risk_analysis["summary"],
+            }
+        )
 
     def _analyze_medication_risks(
-        self, medications: List[Dict], patient_info: Dict
+        self, tokenized_meds: List[Tuple[Dict, str]], patient_info: Dict
     ) -> Dict:
         """Analyze risk profile of medication combination."""
-        risk_level = "low"
         risk_factors = []
+        has_high_risk = False
+        has_moderate_risk = False
 
-        # High-risk medications
-        high_risk_meds = ["warfarin", "insulin", "digoxin", "lithium"]
-        moderate_risk_meds = ["metformin", "lisinopril", "atorvastatin"]
-
-        for med in medications:
-            med_name = med.get("name", "").lower()
-            if any(high_risk in med_name for high_risk in high_risk_meds):
-                risk_level = "high"
+        # First pass only collects risk factors; the level is decided once below
+        for med, med_name in tokenized_meds:
+            if any(high_risk in med_name for high_risk in _HIGH_RISK_MEDS):
+                has_high_risk = True
                 risk_factors.append(f"High-risk medication: {med['name']}")
-            elif any(mod_risk in med_name for mod_risk in moderate_risk_meds):
-                if risk_level == "low":
-                    risk_level = "moderate"
+            elif any(mod_risk in med_name for mod_risk in _MODERATE_RISK_MEDS):
+                has_moderate_risk = True
                 risk_factors.append(f"Moderate-risk medication: {med['name']}")
 
         # Age-based risk factors
         age = patient_info.get("age", 0)
         if age > 65:
             risk_factors.append("Elderly patient (>65 years)")
-            if risk_level == "low":
-                risk_level = "moderate"
+            has_moderate_risk = True
         elif age < 18:
             risk_factors.append("Pediatric patient (<18 years)")
-            if risk_level == "low":
-                risk_level = "moderate"
+            has_moderate_risk = True
 
         # Multiple medication risk
-        if len(medications) > 3:
+        if len(tokenized_meds) > 3:
             risk_factors.append("Polypharmacy (>3 medications)")
-            if risk_level == "low":
-                risk_level = "moderate"
+            has_moderate_risk = True
+
+        if has_high_risk:
+            risk_level = "high"
+        elif has_moderate_risk:
+            risk_level = "moderate"
+        else:
+            risk_level = "low"
 
         summary = (
             f"Risk Level: {risk_level.upper()}. " + "; ".join(risk_factors)
@@ -227,43 +393,38 @@ Provide a comprehensive, professional medication management plan that addresses
         return {"level": risk_level, "factors": risk_factors, "summary": summary}
 
     def _generate_combination_context(
-        self, medications: List[Dict], patient_info: Dict
+        self, tokenized_meds: List[Tuple[Dict, str]], patient_info: Dict
     ) -> str:
         """Generate context for medication combination analysis."""
-        if len(medications) <= 1:
-            return f"Single medication regimen: {medications[0]['name'] if medications else 'No medications'}"
+        if len(tokenized_meds) <= 1:
+            return f"Single medication regimen: {tokenized_meds[0][0]['name'] if tokenized_meds else 'No medications'}"
 
-        medication_names = [med["name"] for med in medications]
-        schedules = [med["schedule"] for med in medications]
+        medication_names = [med["name"] for med, _ in tokenized_meds]
+        schedules = [med["schedule"] for med, _ in tokenized_meds]
 
         # Analyze therapeutic categories
-        therapeutic_analysis = self._analyze_therapeutic_categories(medications)
+        therapeutic_analysis = self._analyze_therapeutic_categories(tokenized_meds)
 
         # Timing analysis
-        timing_analysis = self._analyze_medication_timing(medications)
+        timing_analysis = self._analyze_medication_timing(tokenized_meds)
 
         # Drug interaction potential
-        interaction_analysis = self._analyze_interaction_potential(medication_names)
-
-        combination_context = f"""
-**REGIMEN OVERVIEW:**
-- Total medications: {len(medications)}
-- Medication names: {", ".join(medication_names)}
-- Dosing schedules: {", ".join(set(schedules))}
-
-**THERAPEUTIC CATEGORY ANALYSIS:**
-{therapeutic_analysis}
-
-**TIMING COORDINATION:**
-{timing_analysis}
-
-**INTERACTION ASSESSMENT:**
-{interaction_analysis}
-""".strip()
-
-        return combination_context
+        interaction_analysis = self._analyze_interaction_potential(tokenized_meds)
+
+        return _COMBINATION_TEMPLATE.format_map(
+            {
+                "medication_count": len(tokenized_meds),
+                "medication_names": ", ".join(medication_names),
+                "schedules": ", ".join(set(schedules)),
+                "therapeutic_analysis": therapeutic_analysis,
+                "timing_analysis": timing_analysis,
+                "interaction_analysis": interaction_analysis,
+            }
+        )
 
-    def _analyze_therapeutic_categories(self, medications: List[Dict]) -> str:
+    def _analyze_therapeutic_categories(
+        self, tokenized_meds: List[Tuple[Dict, str]]
+    ) -> str:
         """Analyze therapeutic categories of medications."""
         # Common therapeutic categories mapping
         category_mapping = {
@@ -280,8 +441,7 @@ Provide a comprehensive, professional medication management plan that addresses
         }
 
         categories = []
-        for med in medications:
-            med_name = med["name"].lower()
+        for med, med_name in tokenized_meds:
             category = "Unknown category"
             for drug, cat in category_mapping.items():
                 if drug in med_name:
@@ -296,9 +456,11 @@ Provide a comprehensive, professional medication management plan that addresses
 
         return f"{chr(10).join(categories)}\n{analysis}"
 
-    def _analyze_medication_timing(self, medications: List[Dict]) -> str:
+    def _analyze_medication_timing(
+        self, tokenized_meds: List[Tuple[Dict, str]]
+    ) -> str:
         """Analyze medication timing for optimal coordination."""
-        schedules = [med["schedule"] for med in medications]
+        schedules = [med["schedule"] for med, _ in tokenized_meds]
         unique_schedules = set(schedules)
 
         if len(unique_schedules) == 1:
@@ -308,9 +470,9 @@ Provide a comprehensive, professional medication management plan that addresses
 
         # Identify potential timing conflicts
         conflicts = []
-        for i, med1 in enumerate(medications):
-            for j, med2 in enumerate(medications[i + 1 :], i + 1):
-                if self._has_timing_conflict(med1["name"], med2["name"]):
+        for i, (med1, med1_lower) in enumerate(tokenized_meds):
+            for med2, med2_lower in tokenized_meds[i + 1 :]:
+                if self._has_timing_conflict(med1_lower, med2_lower):
                     conflicts.append(f"{med1['name']} and {med2['name']}")
 
         if conflicts:
@@ -320,8 +482,8 @@ Provide a comprehensive, professional medication management plan that addresses
 
         return timing_note
 
-    def _has_timing_conflict(self, drug1: str, drug2: str) -> bool:
-        """Check if two drugs have potential timing conflicts."""
+    def _has_timing_conflict(self, drug1_lower: str, drug2_lower: str) -> bool:
+        """Check if two lowercased drug names have potential timing conflicts."""
         # Common timing conflicts
         timing_conflicts = [
             ("levothyroxine", "calcium"),
@@ -330,9 +492,6 @@ Provide a comprehensive, professional medication management plan that addresses
             ("tetracycline", "dairy"),
         ]
 
-        drug1_lower = drug1.lower()
-        drug2_lower = drug2.lower()
-
         for conflict_pair in timing_conflicts:
             if (
                 conflict_pair[0] in drug1_lower and conflict_pair[1] in drug2_lower
@@ -340,7 +499,9 @@ Provide a comprehensive, professional medication management plan that addresses
                 return True
         return False
 
-    def _analyze_interaction_potential(self, medication_names: List[str]) -> str:
+    def _analyze_interaction_potential(
+        self, tokenized_meds: List[Tuple[Dict, str]]
+    ) -> str:
         """Analyze potential drug-drug interactions."""
         high_risk_combinations = [
             ("warfarin", "aspirin"),
@@ -359,10 +520,9 @@ Provide a comprehensive, professional medication management plan that addresses
         found_interactions = []
         risk_level = "low"
 
-        for i, med1 in enumerate(medication_names):
-            for j, med2 in enumerate(medication_names[i + 1 :], i + 1):
-                med1_lower = med1.lower()
-                med2_lower = med2.lower()
+        for i, (med1_info, med1_lower) in enumerate(tokenized_meds):
+            for med2_info, med2_lower in tokenized_meds[i + 1 :]:
+                med1, med2 = med1_info["name"], med2_info["name"]
 
                 # Check high-risk combinations
                 for combo in high_risk_combinations:
@@ -407,25 +567,25 @@ Provide a comprehensive, professional medication management plan that addresses
             )
 
             for i, doc in enumerate(sorted_context[:3]):  # Limit to top 3
-                title = doc.get("title", "N/A")
-                content = doc.get("content", "")[:400]
-                relevance = doc.get("relevance_score", 0)
-
                 context_parts.append(
-                    f"""
-**Article {i + 1}:**
-Title: {title}
-Content: {content}...
-Relevance Score: {relevance:.3f}
-""".strip()
+                    _ARTICLE_TEMPLATE.format(
+                        number=i + 1,
+                        title=doc.get("title", "N/A"),
+                        content=doc.get("content", "")[:400],
+                        relevance=doc.get("relevance_score", 0),
+                    )
                 )
 
         # Format MedEx context
         if medex_context:
             context_parts.append("\n**DRUG DATABASE INFORMATION (MedEx):**")
-            combined_medex = "\n".join(medex_context[:2])  # Limit to first 2 entries
-            if len(combined_medex) > 1000:
-                combined_medex = combined_medex[:1000] + "..."
+            # Limit to first 2 entries; pre-slicing each entry keeps the join
+            # from copying whole scraped pages only to truncate them
+            combined_medex = "\n".join(
+                entry[: _MEDEX_CONTEXT_CHARS + 1] for entry in medex_context[:2]
+            )
+            if len(combined_medex) > _MEDEX_CONTEXT_CHARS:
+                combined_medex = combined_medex[:_MEDEX_CONTEXT_CHARS] + "..."
             context_parts.append(combined_medex)
 
         return (
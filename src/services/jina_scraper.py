@@ -1,8 +1,18 @@
-import requests
+import asyncio
+import httpx
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Dict, List
-from config.settings import JINA_BASE_URL, JINA_API_KEY, REQUEST_TIMEOUT, SCRAPING_DELAY
+from config.settings import (
+    JINA_BASE_URL,
+    JINA_API_KEY,
+    REQUEST_TIMEOUT,
+    SCRAPING_DELAY,
+    JINA_MAX_CONCURRENCY,
+    MEDEX_MAX_CONTENT_CHARS,
+    MEDEX_STREAM_CHUNK_SIZE,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +20,6 @@ logger = logging.getLogger(__name__)
 class JinaScraper:
     def __init__(self, api_key: Optional[str] = JINA_API_KEY):
         self.base_url = JINA_BASE_URL
-        self.session = requests.Session()
         headers = {
             "User-Agent": "Mozilla/5.0 (compatible; MedicalAdvisor/1.0)",
             "Accept": "text/plain, application/json",
@@ -20,9 +29,17 @@ class JinaScraper:
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
 
-        self.session.headers.update(headers)
-
-    def scrape_medex_page(self, medex_url: str) -> Optional[str]:
+        # HTTP/2 lets repeated scrapes multiplex over one TLS connection to Jina
+        self.session = httpx.Client(
+            http2=True,
+            headers=headers,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        )
+
+    def scrape_medex_page(
+        self, medex_url: str, max_chars: int = MEDEX_MAX_CONTENT_CHARS
+    ) -> Optional[str]:
         if not medex_url:
             return None
 
@@ -30,38 +47,78 @@ class JinaScraper:
             jina_url = f"{self.base_url}{medex_url}"
             logger.info(f"Scraping URL: {medex_url}")
 
-            response = self.session.get(jina_url, timeout=REQUEST_TIMEOUT)
-
-            if response.status_code == 200:
-                content = response.text
-                logger.info(f"Successfully scraped: {medex_url}")
-                return content
-            else:
-                logger.warning(
-                    f"Failed to scrape {medex_url}: HTTP {response.status_code}"
-                )
-                return None
+            # Leaving the stream context early releases the connection
+            # without draining the rest of the body
+            with self.session.stream("GET", jina_url) as response:
+                if response.status_code == 200:
+                    content = self._read_capped(response, max_chars)
+                    logger.info(f"Successfully scraped: {medex_url}")
+                    return content
+                else:
+                    logger.warning(
+                        f"Failed to scrape {medex_url}: HTTP {response.status_code}"
+                    )
+                    return None
 
         except Exception as e:
             logger.error(f"Unexpected error scraping {medex_url}: {e}")
             return None
 
-    def batch_scrape(self, urls: List[str], delay: float = None) -> Dict[str, str]:
+    def _read_capped(self, response: httpx.Response, max_chars: int) -> str:
+        """Read a streamed response body, stopping once max_chars are buffered."""
+        chunks = []
+        total = 0
+        for chunk in response.iter_text(chunk_size=MEDEX_STREAM_CHUNK_SIZE):
+            if not chunk:
+                continue
+            chunks.append(chunk)
+            total += len(chunk)
+            if total >= max_chars:
+                break
+
+        return "".join(chunks)[:max_chars]
+
+    def batch_scrape(
+        self,
+        urls: List[str],
+        delay: float = None,
+        max_workers: int = JINA_MAX_CONCURRENCY,
+    ) -> Dict[str, str]:
         if delay is None:
             delay = SCRAPING_DELAY
 
-        results = {}
-
-        for i, url in enumerate(urls):
-            if i > 0:
-                time.sleep(delay)
-
-            content = self.scrape_medex_page(url)
-            results[url] = content
+        # Repeated drug lookups are common; fetch each page only once
+        unique_urls = list(dict.fromkeys(urls))
+        if len(unique_urls) < len(urls):
+            logger.info(
+                f"Skipping {len(urls) - len(unique_urls)} duplicate URLs in batch"
+            )
 
-            logger.info(f"Scraped {i + 1}/{len(urls)} URLs")
+        results = {}
 
-        return results
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for i, url in enumerate(unique_urls):
+                # Requests still start at most once per delay, but slow
+                # responses now overlap instead of queueing behind each other
+                if i > 0:
+                    time.sleep(delay)
+                futures[executor.submit(self.scrape_medex_page, url)] = url
+
+            for completed, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                logger.info(f"Scraped {completed}/{len(unique_urls)} URLs")
+
+        return {url: results[url] for url in unique_urls}
+
+    async def batch_scrape_async(
+        self, urls: List[str], delay: float = None
+    ) -> Dict[str, str]:
+        """Run batch_scrape off the event loop so callers can overlap other work."""
+        return await asyncio.to_thread(self.batch_scrape, urls, delay)
+
+    def close(self) -> None:
+        self.session.close()
 
     def test_connection(self) -> bool:
         try:
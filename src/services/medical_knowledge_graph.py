@@ -1,19 +1,74 @@
+import json
 import logging
-import networkx as nx
-from typing import Dict, List, Optional
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import ONTOLOGY_ARTIFACT_PATH
+from ._graph_kernels import UNREACHABLE, all_pairs_shortest_paths, bfs_within
 
 logger = logging.getLogger(__name__)
 
+# Edge attributes are stored as small integer codes parallel to the CSR indices
+RELATIONSHIPS = ("belongs_to_class", "interacts_with", "treats")
+SEVERITIES = ("", "minor", "moderate", "major")
+_PATHWAY_RELATIONSHIPS = (
+    RELATIONSHIPS.index("treats"),
+    RELATIONSHIPS.index("belongs_to_class"),
+)
+
+# Basic contraindications (would be loaded from medical database)
+BASIC_CONTRAINDICATIONS = {
+    "warfarin": ("pregnancy", "active_bleeding", "severe_liver_disease"),
+    "aspirin": ("active_bleeding", "severe_asthma", "children_under_16"),
+    "metformin": ("severe_kidney_disease", "liver_disease", "heart_failure"),
+    "lisinopril": ("pregnancy", "angioedema_history", "bilateral_renal_stenosis"),
+    "atorvastatin": ("active_liver_disease", "pregnancy", "breastfeeding"),
+}
+
 
 class MedicalKnowledgeGraph:
     def __init__(self):
-        self.graph = nx.Graph()
-        self.drug_interactions = {}
+        # Node table: id -> name / type, and name -> id
+        self._names: List[str] = []
+        self._node_types: List[str] = []
+        self._id: Dict[str, int] = {}
+
+        # Edges collected while loading, keyed by (min_id, max_id)
+        self._pending_edges: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+        # Compressed sparse row adjacency, built once the ontology is loaded
+        self._num_edges = 0
+        self._indptr = np.zeros(1, dtype=np.int32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._edge_rel = np.zeros(0, dtype=np.int8)
+        self._edge_sev = np.zeros(0, dtype=np.int8)
+
+        # All-pairs hop counts, filled once after the CSR arrays are built
+        self._dist = np.zeros((0, 0), dtype=np.uint8)
+
+        # Known interactions keyed by (min_id, max_id) of the two drug nodes
+        self.drug_interactions: Dict[Tuple[int, int], Dict] = {}
+
+        # Dense N x N lookup into _interaction_list (-1 where none is known)
+        self._interaction_list: List[Dict] = []
+        self._interaction_index = np.zeros((0, 0), dtype=np.int16)
         self.therapeutic_classes = {}
         self.indication_mappings = {}
-        self._load_medical_ontology()
+        if not self._load_ontology_artifact():
+            if self._load_medical_ontology():
+                self._save_ontology_artifact()
+
+        # The ontology is static once loaded, so graph walks are memoized per
+        # instance; cached results are tuples and callers get fresh lists
+        self._related_concepts = lru_cache(maxsize=512)(self._related_concepts)
+        self._pathway_names = lru_cache(maxsize=512)(self._pathway_names)
 
-    def _load_medical_ontology(self):
+    def _load_medical_ontology(self) -> bool:
         try:
             # Load basic drug classification data
             self._load_drug_classifications()
@@ -24,12 +79,177 @@ class MedicalKnowledgeGraph:
             # Load therapeutic indications
             self._load_therapeutic_indications()
 
+            self._build_csr()
+            self._build_distance_table()
+            self._build_interaction_index()
+
             logger.info(
-                f"Loaded medical knowledge graph with {self.graph.number_of_nodes()} nodes and {self.graph.number_of_edges()} edges"
+                f"Loaded medical knowledge graph with {self.number_of_nodes()} nodes and {self.number_of_edges()} edges"
             )
+            return True
 
         except Exception as e:
             logger.error(f"Error loading medical ontology: {e}")
+            return False
+
+    def _artifact_is_fresh(self) -> bool:
+        """Whether the saved artifact is newer than the code that builds it."""
+        if not ONTOLOGY_ARTIFACT_PATH.exists():
+            return False
+        module_path = Path(__file__)
+        source_mtime = max(
+            module_path.stat().st_mtime,
+            module_path.with_name("_graph_kernels.py").stat().st_mtime,
+        )
+        return ONTOLOGY_ARTIFACT_PATH.stat().st_mtime >= source_mtime
+
+    def _load_ontology_artifact(self) -> bool:
+        """Load the compiled graph saved by a previous run.
+
+        Returns:
+            True if successful, False if the ontology must be rebuilt
+        """
+        try:
+            if not self._artifact_is_fresh():
+                return False
+
+            with np.load(ONTOLOGY_ARTIFACT_PATH) as data:
+                self._names = data["names"].tolist()
+                self._node_types = data["node_types"].tolist()
+                self._num_edges = int(data["num_edges"])
+                self._indptr = data["indptr"]
+                self._indices = data["indices"]
+                self._edge_rel = data["edge_rel"]
+                self._edge_sev = data["edge_sev"]
+                self._dist = data["dist"]
+                self._interaction_index = data["interaction_index"]
+                pairs = data["interaction_pairs"].tolist()
+                mappings = json.loads(str(data["mappings"]))
+
+            self._id = {name: i for i, name in enumerate(self._names)}
+            self.therapeutic_classes = mappings["therapeutic_classes"]
+            self.indication_mappings = mappings["indication_mappings"]
+            self.drug_interactions = {
+                (id1, id2): interaction
+                for (id1, id2), interaction in zip(pairs, mappings["drug_interactions"])
+            }
+            self._interaction_list = list(self.drug_interactions.values())
+
+            logger.info(
+                f"Loaded medical knowledge graph with {self.number_of_nodes()} nodes and {self.number_of_edges()} edges from {ONTOLOGY_ARTIFACT_PATH}"
+            )
+            return True
+
+        except Exception as e:
+            logger.warning(f"Could not load ontology artifact, rebuilding: {e}")
+            return False
+
+    def _save_ontology_artifact(self) -> None:
+        """Save the compiled graph so later processes can skip the build."""
+        tmp_path = None
+        try:
+            mappings = {
+                "therapeutic_classes": self.therapeutic_classes,
+                "indication_mappings": self.indication_mappings,
+                "drug_interactions": self._interaction_list,
+            }
+            # Write to a temporary file of this process's own first, so
+            # concurrent workers neither interleave writes nor read a
+            # partially written artifact
+            with tempfile.NamedTemporaryFile(
+                dir=ONTOLOGY_ARTIFACT_PATH.parent,
+                prefix="ontology.",
+                suffix=".tmp",
+                delete=False,
+            ) as f:
+                tmp_path = f.name
+                np.savez(
+                    f,
+                    names=np.array(self._names),
+                    node_types=np.array(self._node_types),
+                    num_edges=np.array(self._num_edges),
+                    indptr=self._indptr,
+                    indices=self._indices,
+                    edge_rel=self._edge_rel,
+                    edge_sev=self._edge_sev,
+                    dist=self._dist,
+                    interaction_index=self._interaction_index,
+                    interaction_pairs=np.array(
+                        list(self.drug_interactions), dtype=np.int32
+                    ).reshape(-1, 2),
+                    mappings=np.array(json.dumps(mappings)),
+                )
+            os.replace(tmp_path, ONTOLOGY_ARTIFACT_PATH)
+            logger.info(f"Saved medical knowledge graph to {ONTOLOGY_ARTIFACT_PATH}")
+
+        except Exception as e:
+            logger.error(f"Error saving ontology artifact: {e}")
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+
+    def _add_node(self, name: str, node_type: str) -> int:
+        node_id = self._id.get(name)
+        if node_id is None:
+            node_id = len(self._names)
+            self._id[name] = node_id
+            self._names.append(name)
+            self._node_types.append(node_type)
+        else:
+            self._node_types[node_id] = node_type
+        return node_id
+
+    def _add_edge(
+        self, node1: str, node2: str, relationship: str, severity: str = ""
+    ) -> None:
+        id1, id2 = self._id[node1], self._id[node2]
+        key = (id1, id2) if id1 <= id2 else (id2, id1)
+        self._pending_edges[key] = (
+            RELATIONSHIPS.index(relationship),
+            SEVERITIES.index(severity),
+        )
+
+    def _build_csr(self) -> None:
+        """Pack the collected edges into CSR arrays, storing both directions."""
+        n = len(self._names)
+        self._num_edges = len(self._pending_edges)
+        adjacency: List[List[Tuple[int, int, int]]] = [[] for _ in range(n)]
+        for (id1, id2), (rel, sev) in self._pending_edges.items():
+            adjacency[id1].append((id2, rel, sev))
+            if id1 != id2:
+                adjacency[id2].append((id1, rel, sev))
+
+        degrees = np.fromiter((len(adj) for adj in adjacency), np.int32, count=n)
+        self._indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(degrees, out=self._indptr[1:])
+
+        flat = [entry for adj in adjacency for entry in adj]
+        self._indices = np.array([e[0] for e in flat], dtype=np.int32)
+        self._edge_rel = np.array([e[1] for e in flat], dtype=np.int8)
+        self._edge_sev = np.array([e[2] for e in flat], dtype=np.int8)
+
+    def _build_distance_table(self) -> None:
+        """Precompute shortest path lengths between every pair of nodes."""
+        n = len(self._names)
+        self._dist = np.full((n, n), UNREACHABLE, dtype=np.uint8)
+        all_pairs_shortest_paths(self._indptr, self._indices, self._dist)
+
+    def _build_interaction_index(self) -> None:
+        """Lay out known interactions as a symmetric matrix over node ids."""
+        n = len(self._names)
+        self._interaction_list = list(self.drug_interactions.values())
+        self._interaction_index = np.full((n, n), -1, dtype=np.int16)
+        for i, (id1, id2) in enumerate(self.drug_interactions):
+            self._interaction_index[id1, id2] = i
+            self._interaction_index[id2, id1] = i
+
+    def _neighbors(self, node_id: int) -> np.ndarray:
+        return self._indices[self._indptr[node_id] : self._indptr[node_id + 1]]
+
+    def number_of_nodes(self) -> int:
+        return len(self._names)
+
+    def number_of_edges(self) -> int:
+        return self._num_edges
 
     def _load_drug_classifications(self):
         drug_classes = {
@@ -47,12 +267,12 @@ class MedicalKnowledgeGraph:
 
         for drug, classes in drug_classes.items():
             # Add drug node
-            self.graph.add_node(drug, type="drug")
+            self._add_node(drug, "drug")
 
             # Add class nodes and connections
             for drug_class in classes:
-                self.graph.add_node(drug_class, type="drug_class")
-                self.graph.add_edge(drug, drug_class, relationship="belongs_to_class")
+                self._add_node(drug_class, "drug_class")
+                self._add_edge(drug, drug_class, "belongs_to_class")
 
             # Store for quick lookup
             self.therapeutic_classes[drug] = classes
@@ -73,18 +293,23 @@ class MedicalKnowledgeGraph:
         }
 
         for (drug1, drug2), interaction_data in interactions.items():
-            # Add interaction edge
-            if self.graph.has_node(drug1) and self.graph.has_node(drug2):
-                self.graph.add_edge(
-                    drug1,
-                    drug2,
-                    relationship="interacts_with",
-                    severity=interaction_data["severity"],
-                    risk=interaction_data["risk"],
+            id1, id2 = self._id.get(drug1), self._id.get(drug2)
+            if id1 is None or id2 is None:
+                logger.warning(
+                    f"Skipping interaction for unknown drug: {drug1}, {drug2}"
                 )
+                continue
+
+            # Add interaction edge
+            self._add_edge(
+                drug1,
+                drug2,
+                "interacts_with",
+                severity=interaction_data["severity"],
+            )
 
             # Store for quick lookup
-            interaction_key = tuple(sorted([drug1, drug2]))
+            interaction_key = (id1, id2) if id1 <= id2 else (id2, id1)
             self.drug_interactions[interaction_key] = interaction_data
 
     def _load_therapeutic_indications(self):
@@ -118,31 +343,29 @@ class MedicalKnowledgeGraph:
         for drug, conditions in indications.items():
             # Add condition nodes and connections
             for condition in conditions:
-                self.graph.add_node(condition, type="condition")
-                if self.graph.has_node(drug):
-                    self.graph.add_edge(drug, condition, relationship="treats")
+                self._add_node(condition, "condition")
+                if drug in self._id:
+                    self._add_edge(drug, condition, "treats")
 
             # Store for quick lookup
             self.indication_mappings[drug] = conditions
 
     def find_related_concepts(self, medication: str, depth: int = 2) -> List[str]:
         """Find related medical concepts for a medication."""
-        medication = medication.lower()
-        related_concepts = []
+        return list(self._related_concepts(medication.lower(), depth))
 
-        if medication in self.graph:
-            # Find concepts within specified depth
-            try:
-                neighbors = nx.single_source_shortest_path_length(
-                    self.graph, medication, cutoff=depth
-                )
-                related_concepts = [
-                    node for node in neighbors.keys() if node != medication
-                ]
-            except nx.NetworkXError:
-                pass
+    def _related_concepts(self, medication: str, depth: int) -> Tuple[str, ...]:
+        src = self._id.get(medication)
+        if src is None:
+            return ()
 
-        return related_concepts
+        return tuple(self._names[node] for node in self._bfs_within(src, depth))
+
+    def _bfs_within(self, src: int, depth: int) -> np.ndarray:
+        """Return ids reachable from src within depth hops, in BFS order."""
+        out = np.empty(len(self._names), dtype=np.int32)
+        count = bfs_within(self._indptr, self._indices, src, depth, out)
+        return out[:count]
 
     def get_pharmacological_class(self, medication: str) -> List[str]:
         medication = medication.lower()
@@ -157,85 +380,90 @@ class MedicalKnowledgeGraph:
 
         for med in medications:
             med = med.lower()
-            if med in self.graph:
+            if med in self._id:
                 # Find therapeutic targets and pathways
                 pathways[med] = self._get_pathways_for_drug(med)
 
         return pathways
 
     def _get_pathways_for_drug(self, medication: str) -> List[str]:
+        return list(self._pathway_names(medication))
+
+    def _pathway_names(self, medication: str) -> Tuple[str, ...]:
         pathways = []
 
-        if medication in self.graph:
+        node_id = self._id.get(medication)
+        if node_id is not None:
             # Get connected conditions and drug classes
-            neighbors = list(self.graph.neighbors(medication))
-            for neighbor in neighbors:
-                edge_data = self.graph.get_edge_data(medication, neighbor)
-                if edge_data and edge_data.get("relationship") in [
-                    "treats",
-                    "belongs_to_class",
-                ]:
-                    pathways.append(neighbor)
+            start, end = self._indptr[node_id], self._indptr[node_id + 1]
+            for neighbor, rel in zip(
+                self._indices[start:end], self._edge_rel[start:end]
+            ):
+                if rel in _PATHWAY_RELATIONSHIPS:
+                    pathways.append(self._names[neighbor])
 
-        return pathways
+        return tuple(pathways)
 
     def analyze_drug_interactions(self, medications: List[str]) -> List[Dict]:
-        interactions = []
         medications = [med.lower() for med in medications]
-
-        for i, med1 in enumerate(medications):
-            for med2 in medications[i + 1 :]:
-                interaction = self.get_drug_interaction(med1, med2)
-                if interaction:
-                    interactions.append({"drug1": med1, "drug2": med2, **interaction})
-
-        return interactions
+        known = [med for med in medications if med in self._id]
+        if len(known) < 2:
+            return []
+
+        # Gather the pairwise submatrix and keep hits above the diagonal,
+        # which np.nonzero returns in the same order as a nested pair loop
+        ids = np.array([self._id[med] for med in known])
+        pairs = self._interaction_index[np.ix_(ids, ids)]
+        rows, cols = np.nonzero(np.triu(pairs >= 0, 1))
+
+        return [
+            {
+                "drug1": known[i],
+                "drug2": known[j],
+                **self._interaction_list[pairs[i, j]],
+            }
+            for i, j in zip(rows, cols)
+        ]
 
     def get_drug_interaction(self, med1: str, med2: str) -> Optional[Dict]:
-        interaction_key = tuple(sorted([med1.lower(), med2.lower()]))
-        return self.drug_interactions.get(interaction_key)
+        id1, id2 = self._id.get(med1.lower()), self._id.get(med2.lower())
+        if id1 is None or id2 is None:
+            return None
+        return self.drug_interactions.get((id1, id2) if id1 <= id2 else (id2, id1))
 
     def calculate_interaction_risk(self, med1: str, med2: str) -> float:
         """Calculate interaction risk between two medications."""
         med1, med2 = med1.lower(), med2.lower()
+        src, dst = self._id.get(med1), self._id.get(med2)
 
-        if med1 in self.graph and med2 in self.graph:
-            try:
-                # Calculate shortest path as proxy for interaction risk
-                path_length = nx.shortest_path_length(self.graph, med1, med2)
-                # Inverse relationship: shorter path = higher risk
-                return 1.0 / (path_length + 1)
-            except nx.NetworkXNoPath:
+        if src is not None and dst is not None:
+            # Calculate shortest path as proxy for interaction risk
+            path_length = self._shortest_path_length(src, dst)
+            if path_length is None:
                 return 0.0
+            # Inverse relationship: shorter path = higher risk
+            return 1.0 / (path_length + 1)
         return 0.0
 
+    def _shortest_path_length(self, src: int, dst: int) -> Optional[int]:
+        """Unweighted shortest path length, or None if unreachable."""
+        path_length = int(self._dist[src, dst])
+        return None if path_length == UNREACHABLE else path_length
+
     def get_contraindications(
         self, medication: str, patient_conditions: List[str] = None
     ) -> List[str]:
-        contraindications = []
-        medication = medication.lower()
-
-        # Basic contraindications (would be loaded from medical database)
-        basic_contraindications = {
-            "warfarin": ["pregnancy", "active_bleeding", "severe_liver_disease"],
-            "aspirin": ["active_bleeding", "severe_asthma", "children_under_16"],
-            "metformin": ["severe_kidney_disease", "liver_disease", "heart_failure"],
-            "lisinopril": [
-                "pregnancy",
-                "angioedema_history",
-                "bilateral_renal_stenosis",
-            ],
-            "atorvastatin": ["active_liver_disease", "pregnancy", "breastfeeding"],
-        }
-
-        contraindications.extend(basic_contraindications.get(medication, []))
+        basic = BASIC_CONTRAINDICATIONS.get(medication.lower(), ())
+        contraindications = list(basic)
 
         # Check patient-specific contraindications
         if patient_conditions:
-            patient_conditions = [condition.lower() for condition in patient_conditions]
-            for contraindication in contraindications:
-                if contraindication in patient_conditions:
-                    contraindications.append(f"CONTRAINDICATED: {contraindication}")
+            conditions = {condition.lower() for condition in patient_conditions}
+            contraindications.extend(
+                f"CONTRAINDICATED: {contraindication}"
+                for contraindication in basic
+                if contraindication in conditions
+            )
 
         return contraindications
 
@@ -260,25 +488,11 @@ class MedicalKnowledgeGraph:
     def get_stats(self) -> Dict:
         """Get knowledge graph statistics."""
         return {
-            "total_nodes": self.graph.number_of_nodes(),
-            "total_edges": self.graph.number_of_edges(),
-            "drug_nodes": len(
-                [n for n, d in self.graph.nodes(data=True) if d.get("type") == "drug"]
-            ),
-            "condition_nodes": len(
-                [
-                    n
-                    for n, d in self.graph.nodes(data=True)
-                    if d.get("type") == "condition"
-                ]
-            ),
-            "drug_class_nodes": len(
-                [
-                    n
-                    for n, d in self.graph.nodes(data=True)
-                    if d.get("type") == "drug_class"
-                ]
-            ),
+            "total_nodes": self.number_of_nodes(),
+            "total_edges": self.number_of_edges(),
+            "drug_nodes": self._node_types.count("drug"),
+            "condition_nodes": self._node_types.count("condition"),
+            "drug_class_nodes": self._node_types.count("drug_class"),
             "known_interactions": len(self.drug_interactions),
             "therapeutic_mappings": len(self.indication_mappings),
         }
@@ -1,19 +1,185 @@
-import json
+import hashlib
 import logging
+import os
+import tempfile
+import threading
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from sentence_transformers import SentenceTransformer
 from config.settings import (
     PROCESSED_DIR,
     EMBEDDING_MODEL,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_GPU_BATCH_SIZE,
+    INDEX_BUILD_CHUNK_SIZE,
     VECTOR_SEARCH_TOP_K,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    DATA_LOAD_WORKERS,
     FAISS_INDEX_PATH,
     DOCUMENTS_METADATA_PATH,
+    DOCUMENTS_PARQUET_PATH,
+    EMBEDDINGS_PATH,
+    EMBEDDING_CACHE_PATH,
+    HNSW_MIN_DOCUMENTS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
 )
 from .medical_knowledge_graph import MedicalKnowledgeGraph
+from ._relevance_kernels import medical_relevance
 
 logger = logging.getLogger(__name__)
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+    logger.error("FAISS not installed. Install with: pip install faiss-cpu")
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+    logger.warning("pyahocorasick not installed. Matching medications term by term.")
+
+# Loaded models shared by every VectorSearch in the process, keyed by model
+# name, with the device each one was placed on
+_MODEL_CACHE: Dict[str, Tuple[SentenceTransformer, str]] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+# Document keys read when precomputing the relevance components
+_RELEVANCE_COLUMNS = (
+    "title",
+    "content",
+    "mesh_terms",
+    "section_priority",
+    "source_type",
+    "publication_year",
+)
+
+SECTION_KEYWORDS = {
+    "methods": ("methods", "methodology", "design", "participants"),
+    "results": ("results", "findings", "outcomes", "data"),
+    "conclusion": ("conclusion", "conclusions", "summary", "implications"),
+}
+
+# Document types for temporal weighting, checked in order
+DOCUMENT_TYPE_TERMS = (
+    ("drug_safety", ("adverse", "safety", "warning")),
+    ("guidelines", ("guideline", "recommendation")),
+    ("mechanisms", ("mechanism", "pathway", "target")),
+    ("case_studies", ("case", "patient", "report")),
+)
+
+# Number of top relevant results whose MeSH terms expand a query
+EXPANSION_SOURCE_RESULTS = 3
+
+# Fixed context terms appended to the user terms by the search_by_* helpers;
+# their embeddings are computed once and pooled with the user-term embedding
+QUERY_TEMPLATES = {
+    "medications": (
+        "medication",
+        "treatment",
+        "dosage",
+        "side effects",
+        "contraindications",
+        "drug interaction",
+        "pharmacology",
+        "therapeutic monitoring",
+        "adverse events",
+        "efficacy",
+    ),
+    "condition": ("treatment", "management", "therapy", "medication", "guidelines"),
+    "medical_condition": (
+        "treatment",
+        "management",
+        "therapy",
+        "diagnosis",
+        "clinical",
+        "patient",
+        "symptoms",
+        "prevention",
+    ),
+    "symptoms": (
+        "symptoms",
+        "diagnosis",
+        "clinical",
+        "manifestation",
+        "signs",
+        "presentation",
+        "condition",
+        "disease",
+    ),
+    "treatment": (
+        "treatment",
+        "therapy",
+        "intervention",
+        "protocol",
+        "management",
+        "clinical",
+        "guidelines",
+    ),
+}
+
+
+class DocumentTable(Sequence):
+    """Read-only list of document dicts backed by a columnar Arrow table.
+
+    Rows are materialized on access, so loading the metadata does not build
+    a Python dict per document up front.
+    """
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+
+    @staticmethod
+    def _to_document(row: Dict) -> Dict:
+        # Columns are the union of all document keys; drop the ones this
+        # document did not have so dict.get defaults still apply
+        return {key: value for key, value in row.items() if value is not None}
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+        return self._to_document(self.table.slice(index, 1).to_pylist()[0])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for batch in self.table.to_batches():
+            for row in batch.to_pylist():
+                yield self._to_document(row)
+
+    def select(self, columns: Iterable[str]) -> "DocumentTable":
+        """View of the documents restricted to the given keys."""
+        names = set(self.table.column_names)
+        return DocumentTable(self.table.select([c for c in columns if c in names]))
+
+    def value_counts(self, column: str, default: str) -> Dict[str, int]:
+        """Count the values of one key, with missing values counted as default."""
+        if column not in self.table.column_names:
+            return {default: len(self)} if len(self) else {}
+        counts = {}
+        for item in pc.value_counts(self.table.column(column)).to_pylist():
+            key = default if item["values"] is None else item["values"]
+            counts[key] = counts.get(key, 0) + item["counts"]
+        return counts
+
 
 class VectorSearch:
     def __init__(self, model_name: str = None):
@@ -21,19 +187,82 @@ class VectorSearch:
         self.model = None
         self.index = None
         self.documents = []
-        self.embeddings = None
-        self.knowledge_graph = MedicalKnowledgeGraph()
+        self._id_index: Dict[str, int] = {}
+
+        # Query-independent parts of the relevance score, one entry per document
+        self._priority_bonus = np.zeros(0)
+        self._recency_bonus = np.zeros(0)
+        self._temporal_weight = np.zeros(0)
+
+        # Lowercased content tokens and MeSH terms of each document as sorted
+        # ids into a shared vocabulary, in CSR layout
+        self._vocabulary: Dict[str, int] = {}
+        self._content_indptr = np.zeros(1, dtype=np.int64)
+        self._content_indices = np.zeros(0, dtype=np.int32)
+        self._mesh_indptr = np.zeros(1, dtype=np.int64)
+        self._mesh_indices = np.zeros(0, dtype=np.int32)
+        self._template_embeddings: Dict[str, np.ndarray] = {}
+        self.device = "cpu"
         self._load_model()
 
+        # Query embeddings are memoized per instance on the normalized text;
+        # enhanced and templated searches encode the same strings repeatedly
+        self._embed_normalized_query = lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(
+            self._embed_normalized_query
+        )
+
+    @cached_property
+    def knowledge_graph(self) -> MedicalKnowledgeGraph:
+        """Ontology for medication searches, built on first use."""
+        return MedicalKnowledgeGraph()
+
     def _load_model(self):
+        # Hold the lock across the load so concurrent first loads of the same
+        # model do not each build their own copy
+        with _MODEL_CACHE_LOCK:
+            cached = _MODEL_CACHE.get(self.model_name)
+            if cached is None:
+                self._load_new_model()
+                if self.model:
+                    _MODEL_CACHE[self.model_name] = (self.model, self.device)
+            else:
+                self.model, self.device = cached
+
+    def _load_new_model(self):
         try:
-            self.model = SentenceTransformer(self.model_name)
-            logger.info(f"Loaded sentence transformer model: {self.model_name}")
+            import torch
+
+            if torch.cuda.is_available():
+                # Half precision on GPU runs the encoder on tensor cores
+                self.device = "cuda"
+                self.model = SentenceTransformer(self.model_name, device=self.device)
+                self.model.half()
+            else:
+                self.model = self._load_onnx_model() or SentenceTransformer(
+                    self.model_name
+                )
+            logger.info(
+                f"Loaded sentence transformer model: {self.model_name} ({self.device})"
+            )
         except ImportError:
             logger.error("sentence-transformers not installed")
         except Exception as e:
             logger.error(f"Failed to load sentence transformer model: {e}")
 
+    def _load_onnx_model(self) -> Optional[SentenceTransformer]:
+        """Load the int8-quantized ONNX export of the model for CPU inference."""
+        try:
+            model = SentenceTransformer(
+                self.model_name,
+                backend="onnx",
+                model_kwargs={"file_name": EMBEDDING_ONNX_FILE},
+            )
+            self.device = "onnx"
+            return model
+        except Exception as e:
+            logger.info(f"ONNX backend unavailable, using PyTorch: {e}")
+            return None
+
     def load_processed_data(self, data_dir: str = None) -> None:
         if not self.model:
             logger.error("Model not loaded. Cannot process documents.")
@@ -50,35 +279,14 @@ class VectorSearch:
             logger.warning(f"No JSON files found in {data_path}")
             return
 
-        for json_file in json_files:
-            try:
-                with open(json_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                # Handle different data formats
-                if isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, dict):
-                            doc = self._format_document(item, json_file.name)
-                            if doc:
-                                # Handle both single docs and lists of docs from hierarchical chunking
-                                if isinstance(doc, list):
-                                    documents.extend(doc)
-                                else:
-                                    documents.append(doc)
-                elif isinstance(data, dict):
-                    doc = self._format_document(data, json_file.name)
-                    if doc:
-                        # Handle both single docs and lists of docs from hierarchical chunking
-                        if isinstance(doc, list):
-                            documents.extend(doc)
-                        else:
-                            documents.append(doc)
-
-            except Exception as e:
-                logger.error(f"Error loading {json_file}: {e}")
+        # Read, parse and format files concurrently, keeping file order
+        with ThreadPoolExecutor(max_workers=DATA_LOAD_WORKERS) as executor:
+            for file_documents in executor.map(self._load_json_file, json_files):
+                documents.extend(file_documents)
 
         self.documents = documents
+        self._build_id_index()
+        self._build_relevance_arrays()
         logger.info(f"Loaded {len(documents)} documents")
 
         if documents:
@@ -86,12 +294,52 @@ class VectorSearch:
         else:
             logger.warning("No documents loaded for indexing")
 
+    def _load_json_file(self, json_file: Path) -> List[Dict]:
+        """Read one JSON file and format its records for indexing."""
+        documents = []
+        try:
+            data = orjson.loads(json_file.read_bytes())
+
+            # Handle different data formats
+            if isinstance(data, list):
+                for item in data:
+                    if isinstance(item, dict):
+                        doc = self._format_document(item, json_file.name)
+                        if doc:
+                            # Handle both single docs and lists of docs from hierarchical chunking
+                            if isinstance(doc, list):
+                                documents.extend(doc)
+                            else:
+                                documents.append(doc)
+            elif isinstance(data, dict):
+                doc = self._format_document(data, json_file.name)
+                if doc:
+                    # Handle both single docs and lists of docs from hierarchical chunking
+                    if isinstance(doc, list):
+                        documents.extend(doc)
+                    else:
+                        documents.append(doc)
+
+        except Exception as e:
+            logger.error(f"Error loading {json_file}: {e}")
+
+        return documents
+
     def _format_document(self, item: Dict, source_file: str) -> Optional[Dict]:
         """Format document for indexing with medical section awareness."""
         # Handle PubMed articles format with enhanced section processing
         if "pmid" in item:
             sections = self._extract_medical_sections(item)
 
+            # Every section of an article is embedded from the same text:
+            # title, abstract and MeSH terms
+            mesh_terms = item.get("mesh_terms", [])
+            embed_text = self._embedding_text(
+                item.get("title", ""),
+                item.get("abstract", ""),
+                "Medical terms: " + " ".join(mesh_terms) if mesh_terms else "",
+            )
+
             formatted_docs = []
             for section_type, content in sections.items():
                 if content:
@@ -107,6 +355,7 @@ class VectorSearch:
                         "publication_year": item.get("year", 0),
                         "abstract": item.get("abstract", ""),
                         "publication_date": item.get("publication_date", ""),
+                        "_embed_text": embed_text,
                     }
                     formatted_docs.append(doc)
             return formatted_docs if formatted_docs else None
@@ -122,6 +371,9 @@ class VectorSearch:
             if not text_content:
                 return None
 
+            # Truncate very long WHO guideline bodies to first 2000 chars for better embedding
+            embed_body = body[:2000] + "..." if len(body) > 2000 else body
+
             return {
                 "id": str(item["id"]),
                 "title": title,
@@ -132,6 +384,7 @@ class VectorSearch:
                 "section_priority": 4,
                 "body": body,
                 "keywords": item.get("keywords", []),
+                "_embed_text": self._embedding_text(title, embed_body),
             }
 
         # Fallback for other formats
@@ -154,9 +407,11 @@ class VectorSearch:
             if not text_content:
                 return None
 
+            title = str(item.get("title", ""))
+
             return {
                 "id": str(item.get("id", item.get("pmid", item.get("guid", "")))),
-                "title": str(item.get("title", "")),
+                "title": title,
                 "content": text_content,
                 "source": str(item.get("source", source_file)),
                 "source_type": "processed_data",
@@ -164,8 +419,14 @@ class VectorSearch:
                 "section_priority": 2,
                 "mesh_terms": item.get("mesh_terms", []),
                 "keywords": item.get("keywords", []),
+                "_embed_text": self._embedding_text(title, text_content),
             }
 
+    @staticmethod
+    def _embedding_text(*parts: str) -> str:
+        """Join the non-empty parts and collapse whitespace for embedding."""
+        return " ".join(" ".join(part for part in parts if part).split())
+
     def _extract_medical_sections(self, item: Dict) -> Dict[str, str]:
         """Extract medical sections from document."""
         sections = {}
@@ -181,36 +442,47 @@ class VectorSearch:
         if abstract:
             abstract_lower = abstract.lower()
             if "methods" in abstract_lower or "methodology" in abstract_lower:
-                sections["methodology"] = self._extract_section(abstract, "methods")
+                sections["methodology"] = self._extract_section(
+                    abstract, "methods", abstract_lower
+                )
             if "results" in abstract_lower:
-                sections["results"] = self._extract_section(abstract, "results")
+                sections["results"] = self._extract_section(
+                    abstract, "results", abstract_lower
+                )
             if "conclusion" in abstract_lower or "conclusions" in abstract_lower:
-                sections["conclusions"] = self._extract_section(abstract, "conclusion")
+                sections["conclusions"] = self._extract_section(
+                    abstract, "conclusion", abstract_lower
+                )
 
         return sections
 
-    def _extract_section(self, text: str, section_type: str) -> str:
-        """Extract specific section from text."""
-        text_lower = text.lower()
-        section_keywords = {
-            "methods": ["methods", "methodology", "design", "participants"],
-            "results": ["results", "findings", "outcomes", "data"],
-            "conclusion": ["conclusion", "conclusions", "summary", "implications"],
-        }
+    def _extract_section(
+        self, text: str, section_type: str, text_lower: Optional[str] = None
+    ) -> str:
+        """Extract specific section from text.
 
-        keywords = section_keywords.get(section_type, [])
+        Callers that already lowercased the text can pass it as text_lower.
+        """
+        if text_lower is None:
+            text_lower = text.lower()
+        keywords = SECTION_KEYWORDS.get(section_type, ())
         for keyword in keywords:
-            if keyword in text_lower:
-                # Simple extraction - in practice, this would be more sophisticated
-                start_idx = text_lower.find(keyword)
-                if start_idx != -1:
-                    # Extract sentence containing the keyword and following sentences
-                    sentences = text[start_idx:].split(".")
-                    return (
-                        ". ".join(sentences[:2]) + "."
-                        if len(sentences) > 1
-                        else sentences[0]
-                    )
+            # Simple extraction - in practice, this would be more sophisticated
+            start_idx = text_lower.find(keyword)
+            if start_idx != -1:
+                # Extract sentence containing the keyword and the one after it,
+                # locating the two boundaries directly instead of splitting
+                # the whole remainder of the text
+                first_end = text.find(".", start_idx)
+                if first_end == -1:
+                    return text[start_idx:]
+                second_end = text.find(".", first_end + 1)
+                if second_end == -1:
+                    second_end = len(text)
+                return (
+                    f"{text[start_idx:first_end]}. "
+                    f"{text[first_end + 1:second_end]}."
+                )
 
         return ""
 
@@ -229,63 +501,46 @@ class VectorSearch:
 
     def _create_index(self) -> None:
         """Create FAISS index from documents."""
-        try:
-            import faiss
-        except ImportError:
+        if faiss is None:
             logger.error("FAISS not installed. Install with: pip install faiss-cpu")
             return
 
         logger.info("Creating vector embeddings...")
 
-        # Combine title and content for embedding with better text preparation
-        texts = []
-        for doc in self.documents:
-            text_parts = []
-
-            # Always include title if available
-            if doc.get("title"):
-                text_parts.append(doc["title"])
-
-            # For PubMed articles, prioritize abstract
-            if doc.get("source_type") == "pubmed_article":
-                if doc.get("abstract"):
-                    text_parts.append(doc["abstract"])
-                if doc.get("mesh_terms"):
-                    text_parts.append("Medical terms: " + " ".join(doc["mesh_terms"]))
-
-            # For WHO guidelines, use body content
-            elif doc.get("source_type") == "who_guideline":
-                if doc.get("body"):
-                    # Truncate very long WHO guideline bodies to first 2000 chars for better embedding
-                    body = doc["body"]
-                    if len(body) > 2000:
-                        body = body[:2000] + "..."
-                    text_parts.append(body)
-
-            # Fallback to content field
-            else:
-                if doc.get("content"):
-                    text_parts.append(doc["content"])
-
-            full_text = " ".join(text_parts)
-            # Clean up text - remove excessive whitespace
-            full_text = " ".join(full_text.split())
-            texts.append(full_text)
+        # Embedding text is prepared by _format_document; drop it from the
+        # documents so it is not written out with the metadata
+        texts = [doc.pop("_embed_text", "") for doc in self.documents]
 
-        # Generate embeddings
+        # Generate embeddings chunk by chunk and add each to the index as it
+        # arrives, so the full float32 matrix is never held next to the index
         try:
-            embeddings = self.model.encode(texts, show_progress_bar=True, batch_size=32)
-            self.embeddings = embeddings
-
-            # Create FAISS index
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(
-                dimension
-            )  # Inner product for cosine similarity
-
-            # Normalize embeddings for cosine similarity
-            faiss.normalize_L2(embeddings)
-            self.index.add(embeddings)
+            index = None
+            for embeddings in self._iter_embeddings(texts):
+                if index is None:
+                    # Create FAISS index; exact search is cheap for small
+                    # collections, larger ones use an HNSW graph over fp16
+                    # vectors, which halves the index size and the bytes
+                    # read per query
+                    dimension = embeddings.shape[1]
+                    if len(texts) >= HNSW_MIN_DOCUMENTS:
+                        index = faiss.IndexHNSWSQ(
+                            dimension,
+                            faiss.ScalarQuantizer.QT_fp16,
+                            HNSW_M,
+                            faiss.METRIC_INNER_PRODUCT,
+                        )
+                        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+                        # The fp16 quantizer has no learned parameters, so
+                        # the first chunk is enough to train it
+                        index.train(embeddings)
+                    else:
+                        index = faiss.IndexFlatIP(
+                            dimension
+                        )  # Inner product for cosine similarity
+                index.add(embeddings)
+
+            self.index = index
+            self._configure_index()
 
             logger.info(f"Created index with {self.index.ntotal} documents")
 
@@ -295,41 +550,197 @@ class VectorSearch:
         except Exception as e:
             logger.error(f"Error creating embeddings: {e}")
 
+    def _iter_embeddings(self, texts: List[str]) -> Iterator[np.ndarray]:
+        """Yield normalized float32 embeddings of texts, one chunk at a time.
+
+        Each distinct text is encoded once. Embeddings are kept on disk by
+        content hash, so a rebuild only encodes texts it has not seen before.
+        """
+        # Sections of the same article and records repeated across files
+        # share their embedding text
+        unique_texts = list(dict.fromkeys(texts))
+        positions = {text: i for i, text in enumerate(unique_texts)}
+        inverse = np.fromiter((positions[text] for text in texts), np.intp, len(texts))
+        digests = [
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+            for text in unique_texts
+        ]
+
+        cached_rows, cached = self._load_embedding_cache()
+        dimension = self.model.get_sentence_embedding_dimension()
+        if not dimension:
+            dimension = self._encode_documents(unique_texts[:1]).shape[1]
+
+        # Unique embeddings go to a memory-mapped file that becomes the
+        # cache for the next build; each build maps its own file so
+        # concurrent builds never overwrite each other's rows
+        fd, rows_name = tempfile.mkstemp(
+            dir=EMBEDDINGS_PATH.parent, prefix="document_embeddings.", suffix=".tmp.npy"
+        )
+        os.close(fd)
+        rows_path = Path(rows_name)
+        try:
+            rows = np.lib.format.open_memmap(
+                rows_path, mode="w+", dtype=np.float32, shape=(len(digests), dimension)
+            )
+            filled = 0
+            encoded = 0
+            for start in range(0, len(texts), INDEX_BUILD_CHUNK_SIZE):
+                chunk = inverse[start : start + INDEX_BUILD_CHUNK_SIZE]
+
+                # Unique texts are numbered by first appearance, so a chunk only
+                # needs the ones past those filled for earlier chunks
+                stop = chunk.max() + 1
+                if stop > filled:
+                    new = range(filled, stop)
+                    hits = [i for i in new if digests[i] in cached]
+                    missing = [i for i in new if digests[i] not in cached]
+                    if hits:
+                        rows[hits] = cached_rows[[cached[digests[i]] for i in hits]]
+                    if missing:
+                        rows[missing] = self._encode_documents(
+                            [unique_texts[i] for i in missing]
+                        )
+                    encoded += len(missing)
+                    filled = stop
+
+                yield np.asarray(rows[chunk])
+
+            logger.info(
+                f"Encoded {encoded} of {len(digests)} unique texts "
+                f"for {len(texts)} documents"
+            )
+            rows.flush()
+            del rows, cached_rows
+            self._save_embedding_cache(digests, rows_path)
+        finally:
+            # Remove the rows if the build stopped before the cache took them over
+            rows_path.unlink(missing_ok=True)
+
+    def _encode_documents(self, texts: List[str]) -> np.ndarray:
+        batch_size = (
+            EMBEDDING_GPU_BATCH_SIZE if self.device == "cuda" else EMBEDDING_BATCH_SIZE
+        )
+        # Keep the output on the encoding device and normalize there for
+        # cosine similarity; FAISS only needs float32 at add time.
+        # encode() already sorts inputs by length before batching and
+        # restores the order afterwards, so batches are not padded to
+        # the longest text in the corpus
+        embeddings = self.model.encode(
+            texts,
+            show_progress_bar=True,
+            batch_size=batch_size,
+            convert_to_tensor=True,
+            normalize_embeddings=True,
+        )
+        return embeddings.float().cpu().numpy()
+
+    def _embedding_cache_tag(self) -> str:
+        # Backends and precisions produce slightly different vectors
+        return f"{self.model_name}:{self.device}"
+
+    def _load_embedding_cache(self) -> Tuple[Optional[np.ndarray], Dict[str, int]]:
+        """Map content hashes to rows of the embeddings saved by the last build."""
+        try:
+            if not (EMBEDDING_CACHE_PATH.exists() and EMBEDDINGS_PATH.exists()):
+                return None, {}
+            with np.load(EMBEDDING_CACHE_PATH) as data:
+                tag = str(data["tag"])
+                digests = data["digests"].tolist()
+            rows = np.load(EMBEDDINGS_PATH, mmap_mode="r")
+            if tag != self._embedding_cache_tag() or len(digests) != len(rows):
+                return None, {}
+            return rows, {digest: i for i, digest in enumerate(digests)}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache: {e}")
+            return None, {}
+
+    def _save_embedding_cache(self, digests: List[str], rows_path: Path) -> None:
+        """Keep the embeddings of the current corpus for the next build."""
+        tmp_path = None
+        try:
+            # A temporary file of this build's own, so concurrent builds
+            # never write into the same file
+            with tempfile.NamedTemporaryFile(
+                dir=EMBEDDING_CACHE_PATH.parent,
+                prefix="embedding_cache.",
+                suffix=".tmp",
+                delete=False,
+            ) as f:
+                tmp_path = f.name
+                np.savez(f, tag=np.array(self._embedding_cache_tag()), digests=digests)
+            # Drop the old hashes first so they never describe the new rows
+            EMBEDDING_CACHE_PATH.unlink(missing_ok=True)
+            os.replace(rows_path, EMBEDDINGS_PATH)
+            os.replace(tmp_path, EMBEDDING_CACHE_PATH)
+        except Exception as e:
+            logger.error(f"Error saving embedding cache: {e}")
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+
+    def _configure_index(self) -> None:
+        """Apply query-time parameters to the loaded index."""
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+
     def _save_index(self):
         """Save FAISS index and document metadata to disk."""
         try:
-            import faiss
-
             # Save FAISS index
             faiss.write_index(self.index, str(FAISS_INDEX_PATH))
 
             # Save document metadata
-            with open(DOCUMENTS_METADATA_PATH, "w", encoding="utf-8") as f:
-                json.dump(self.documents, f, indent=2, ensure_ascii=False)
+            self._save_documents()
 
             logger.info("Saved index and metadata to disk")
 
         except Exception as e:
             logger.error(f"Error saving index: {e}")
 
+    def _save_documents(self) -> None:
+        """Save document metadata as Parquet, or JSON if it cannot be typed."""
+        try:
+            keys = dict.fromkeys(key for doc in self.documents for key in doc)
+            table = pa.table(
+                {key: [doc.get(key) for doc in self.documents] for key in keys}
+            )
+            pq.write_table(table, DOCUMENTS_PARQUET_PATH, compression="zstd")
+            return
+        except (pa.ArrowException, TypeError) as e:
+            logger.warning(f"Saving metadata as JSON, not Parquet: {e}")
+
+        DOCUMENTS_PARQUET_PATH.unlink(missing_ok=True)
+        DOCUMENTS_METADATA_PATH.write_bytes(orjson.dumps(self.documents))
+
     def _load_index(self) -> bool:
         """Load FAISS index and document metadata from disk.
 
         Returns:
             True if successful, False otherwise
         """
-        try:
-            import faiss
+        if faiss is None:
+            return False
 
-            if not FAISS_INDEX_PATH.exists() or not DOCUMENTS_METADATA_PATH.exists():
+        try:
+            if not FAISS_INDEX_PATH.exists() or not (
+                DOCUMENTS_PARQUET_PATH.exists() or DOCUMENTS_METADATA_PATH.exists()
+            ):
                 return False
 
             # Load FAISS index
             self.index = faiss.read_index(str(FAISS_INDEX_PATH))
-
-            # Load document metadata
-            with open(DOCUMENTS_METADATA_PATH, "r", encoding="utf-8") as f:
-                self.documents = json.load(f)
+            self._configure_index()
+
+            # Load document metadata, preferring the columnar copy
+            if DOCUMENTS_PARQUET_PATH.exists():
+                table = pq.read_table(DOCUMENTS_PARQUET_PATH, memory_map=True)
+                self.documents = DocumentTable(table)
+                self._build_id_index(table.column("id").to_pylist())
+                self._build_relevance_arrays()
+            else:
+                self.documents = orjson.loads(DOCUMENTS_METADATA_PATH.read_bytes())
+                self._build_id_index()
+                self._build_relevance_arrays()
 
             logger.info(f"Loaded index with {len(self.documents)} documents from disk")
             return True
@@ -338,12 +749,15 @@ class VectorSearch:
             logger.error(f"Error loading index from disk: {e}")
             return False
 
-    def search(self, query: str, k: int = None) -> List[Dict]:
+    def search(
+        self, query: str, k: int = None, query_embedding: np.ndarray = None
+    ) -> List[Dict]:
         """Search for relevant documents with enhanced medical relevance scoring.
 
         Args:
             query: Search query
             k: Number of results to return
+            query_embedding: Precomputed normalized embedding for the query
 
         Returns:
             List of relevant documents with scores
@@ -355,82 +769,180 @@ class VectorSearch:
         k = k or VECTOR_SEARCH_TOP_K
 
         try:
-            # Encode query
-            query_embedding = self.model.encode([query])
-
-            import faiss
-
-            faiss.normalize_L2(query_embedding)
+            if query_embedding is None:
+                query_embedding = self._encode_query(query)
 
             # Get more results for re-ranking
             extended_k = min(k * 3, len(self.documents))
-            scores, indices = self.index.search(query_embedding, extended_k)
-
-            results = []
-            query_terms = set(query.lower().split())
-
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if idx < len(self.documents):
-                    doc = self.documents[idx].copy()
+            if hasattr(self.index, "hnsw"):
+                # Widen the HNSW beam for larger result sets; passed per call
+                # so concurrent searches never race on the index's setting
+                params = faiss.SearchParametersHNSW(
+                    efSearch=max(HNSW_EF_SEARCH, extended_k * 2)
+                )
+                scores, indices = self.index.search(
+                    query_embedding, extended_k, params=params
+                )
+            else:
+                scores, indices = self.index.search(query_embedding, extended_k)
 
-                    # Calculate enhanced relevance score
-                    enhanced_score = self._calculate_medical_relevance(
-                        doc, query_terms, float(score)
-                    )
+            # FAISS pads with -1 when it finds fewer than extended_k hits
+            hits = [
+                (rank, int(idx))
+                for rank, idx in enumerate(indices[0])
+                if 0 <= idx < len(self.documents)
+            ]
+            if not hits:
+                return []
 
-                    doc["relevance_score"] = enhanced_score
-                    doc["rank"] = i + 1
-                    results.append(doc)
+            ranks = np.array([rank for rank, _ in hits])
+            doc_ids = np.array([idx for _, idx in hits], dtype=np.int64)
+            candidates = [self.documents[idx] for idx in doc_ids]
 
-            # Re-rank based on enhanced scores
-            results = sorted(results, key=lambda x: x["relevance_score"], reverse=True)
-            return results[:k]
+            # Calculate enhanced relevance scores for all candidates at once
+            query_terms = set(query.lower().split())
+            term_ids = np.array(
+                [self._vocabulary[t] for t in query_terms if t in self._vocabulary],
+                dtype=np.int32,
+            )
+            relevance = medical_relevance(
+                np.ascontiguousarray(scores[0][ranks], dtype=np.float32),
+                doc_ids,
+                self._content_indptr,
+                self._content_indices,
+                self._mesh_indptr,
+                self._mesh_indices,
+                term_ids,
+                len(query_terms),
+                self._priority_bonus,
+                self._recency_bonus,
+                self._temporal_weight,
+            )
+
+            # Re-rank based on enhanced scores: select the top k in linear
+            # time, then order just those, keeping FAISS order among ties.
+            # argpartition picks arbitrarily among scores tied with the k-th,
+            # so those are filled in FAISS order instead
+            if len(relevance) > k:
+                kth = -np.partition(-relevance, k - 1)[k - 1]
+                above = np.flatnonzero(relevance > kth)
+                tied = np.flatnonzero(relevance == kth)[: k - len(above)]
+                top = np.concatenate((above, tied))
+            else:
+                top = np.arange(len(relevance))
+            top = top[np.lexsort((top, -relevance[top]))]
+
+            return [
+                {
+                    **candidates[j],
+                    "relevance_score": float(relevance[j]),
+                    "rank": int(ranks[j]) + 1,
+                }
+                for j in top
+            ]
 
         except Exception as e:
             logger.error(f"Error during enhanced search: {e}")
             return []
 
-    def _calculate_medical_relevance(
-        self, doc: Dict, query_terms: set, base_score: float
-    ) -> float:
-        """Calculate enhanced medical relevance score."""
-        score = base_score
+    def _encode_query(self, text: str) -> np.ndarray:
+        """Encode text as a normalized float32 query embedding.
 
-        # Medical term overlap bonus
-        content_terms = set(doc.get("content", "").lower().split())
-        mesh_terms = set([term.lower() for term in doc.get("mesh_terms", [])])
+        Embeddings are cached and shared between calls; do not modify them
+        in place.
+        """
+        # The embedding model is uncased, so case and spacing do not matter
+        return self._embed_normalized_query(" ".join(text.lower().split()))
 
-        term_overlap = (
-            len(query_terms.intersection(content_terms)) / len(query_terms)
-            if query_terms
-            else 0
-        )
-        mesh_overlap = (
-            len(query_terms.intersection(mesh_terms)) / len(query_terms)
-            if query_terms
-            else 0
+    def _embed_normalized_query(self, text: str) -> np.ndarray:
+        return np.ascontiguousarray(
+            self.model.encode([text], normalize_embeddings=True), dtype=np.float32
         )
 
-        score += term_overlap * 0.2
-        score += mesh_overlap * 0.3
+    def _search_template(self, template: str, terms: str, k: int = None) -> List[Dict]:
+        """Search user terms combined with one of the fixed QUERY_TEMPLATES.
 
-        # Section priority bonus
-        section_priority = doc.get("section_priority", 1)
-        score += (section_priority / 5) * 0.1
+        Only the user terms are encoded per call; the template embedding is
+        cached and mean-pooled with them.
+        """
+        query = " ".join(filter(None, (terms, " ".join(QUERY_TEMPLATES[template]))))
+        if not self.model or not self.index:
+            return self.search(query, k)
 
-        # Publication recency bonus (for PubMed articles)
-        if doc.get("source_type") == "pubmed_article":
-            pub_year = doc.get("publication_year", 2000)
-            current_year = 2024
-            if pub_year > 0:
-                recency_score = max(0, (pub_year - 2000) / (current_year - 2000))
-                score += recency_score * 0.1
+        try:
+            query_embedding = self._template_embeddings.get(template)
+            if query_embedding is None:
+                query_embedding = self._encode_query(
+                    " ".join(QUERY_TEMPLATES[template])
+                )
+                self._template_embeddings[template] = query_embedding
+
+            if terms:
+                query_embedding = query_embedding + self._encode_query(terms)
+                faiss.normalize_L2(query_embedding)
+        except Exception as e:
+            logger.error(f"Error encoding templated query: {e}")
+            return []
 
-        # Temporal relevance weighting
-        temporal_weight = self._calculate_temporal_relevance(doc)
-        score *= temporal_weight
+        return self.search(query, k, query_embedding=query_embedding)
 
-        return score
+    def _build_relevance_arrays(self) -> None:
+        """Precompute the query-independent medical relevance components."""
+        current_year = 2024
+        n = len(self.documents)
+        self._priority_bonus = np.empty(n)
+        self._recency_bonus = np.zeros(n)
+        self._temporal_weight = np.empty(n)
+        vocabulary: Dict[str, int] = {}
+        content_rows = []
+        mesh_rows = []
+
+        documents = self.documents
+        if isinstance(documents, DocumentTable):
+            # Only materialize the keys the relevance components read
+            documents = documents.select(_RELEVANCE_COLUMNS)
+
+        for i, doc in enumerate(documents):
+            # Term ids for the query overlap counts
+            content_rows.append(
+                self._term_ids(vocabulary, doc.get("content", "").lower().split())
+            )
+            mesh_rows.append(
+                self._term_ids(
+                    vocabulary, (term.lower() for term in doc.get("mesh_terms", []))
+                )
+            )
+
+            # Section priority bonus
+            section_priority = doc.get("section_priority", 1)
+            self._priority_bonus[i] = (section_priority / 5) * 0.1
+
+            # Publication recency bonus (for PubMed articles)
+            if doc.get("source_type") == "pubmed_article":
+                pub_year = doc.get("publication_year", 2000)
+                if pub_year > 0:
+                    recency_score = max(0, (pub_year - 2000) / (current_year - 2000))
+                    self._recency_bonus[i] = recency_score * 0.1
+
+            # Temporal relevance weighting
+            self._temporal_weight[i] = self._calculate_temporal_relevance(doc)
+
+        self._vocabulary = vocabulary
+        self._content_indptr, self._content_indices = self._to_csr(content_rows)
+        self._mesh_indptr, self._mesh_indices = self._to_csr(mesh_rows)
+
+    @staticmethod
+    def _term_ids(vocabulary: Dict[str, int], terms: Iterable[str]) -> np.ndarray:
+        """Sorted distinct ids of terms, adding unseen terms to vocabulary."""
+        ids = sorted({vocabulary.setdefault(term, len(vocabulary)) for term in terms})
+        return np.array(ids, dtype=np.int32)
+
+    @staticmethod
+    def _to_csr(rows: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        return indptr, indices
 
     def _calculate_temporal_relevance(self, doc: Dict) -> float:
         """Calculate temporal relevance for medical documents."""
@@ -458,19 +970,13 @@ class VectorSearch:
 
     def _classify_document_type(self, doc: Dict) -> str:
         """Classify document type for temporal weighting."""
-        title = doc.get("title", "").lower()
-        content = doc.get("content", "").lower()
+        # Concatenate once; the terms are tested in priority order, so the
+        # first matching group wins regardless of where its term appears
+        text = doc.get("title", "").lower() + doc.get("content", "").lower()
 
-        if any(term in title + content for term in ["adverse", "safety", "warning"]):
-            return "drug_safety"
-        elif any(term in title + content for term in ["guideline", "recommendation"]):
-            return "guidelines"
-        elif any(
-            term in title + content for term in ["mechanism", "pathway", "target"]
-        ):
-            return "mechanisms"
-        elif any(term in title + content for term in ["case", "patient", "report"]):
-            return "case_studies"
+        for doc_type, terms in DOCUMENT_TYPE_TERMS:
+            if any(term in text for term in terms):
+                return doc_type
 
         return "general"
 
@@ -502,23 +1008,8 @@ class VectorSearch:
             if indications:
                 query_parts.extend(indications)
 
-        # Add medical context terms with weights
-        medical_terms = [
-            "medication",
-            "treatment",
-            "dosage",
-            "side effects",
-            "contraindications",
-            "drug interaction",
-            "pharmacology",
-            "therapeutic monitoring",
-            "adverse events",
-            "efficacy",
-        ]
-        query_parts.extend(medical_terms)
-
-        query = " ".join(query_parts)
-        return self.search(query, k)
+        # Medical context terms come from the precomputed template
+        return self._search_template("medications", " ".join(query_parts), k)
 
     def enhanced_medical_search(
         self,
@@ -559,20 +1050,42 @@ class VectorSearch:
         if not medications:
             return results
 
-        relevant_results = []
+        return list(self._iter_medical_relevance(results, medications))
+
+    def _iter_medical_relevance(
+        self, results: List[Dict], medications: List[str]
+    ) -> Iterator[Dict]:
+        """Yield the results that mention one of the medications, in order."""
+        if not medications:
+            yield from results
+            return
+
         med_terms = set([med.lower() for med in medications])
+        mentions_medication = self._medication_matcher(med_terms)
 
         for result in results:
             content = result.get("content", "").lower()
             mesh_terms = set([term.lower() for term in result.get("mesh_terms", [])])
 
             # Check for medication mentions or related terms
-            if any(med in content for med in med_terms) or mesh_terms.intersection(
-                med_terms
-            ):
-                relevant_results.append(result)
+            if mentions_medication(content) or mesh_terms.intersection(med_terms):
+                yield result
+
+    @staticmethod
+    def _medication_matcher(med_terms: set) -> Callable[[str], bool]:
+        """Return a test for whether a text contains any of med_terms.
+
+        Several terms are matched in a single pass over the text with an
+        Aho-Corasick automaton; a lone term is a plain substring check.
+        """
+        if ahocorasick is None or len(med_terms) < 2 or "" in med_terms:
+            return lambda text: any(med in text for med in med_terms)
 
-        return relevant_results
+        automaton = ahocorasick.Automaton()
+        for med in med_terms:
+            automaton.add_word(med, med)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
 
     def _expand_query_from_results(
         self, original_query: str, results: List[Dict]
@@ -581,7 +1094,7 @@ class VectorSearch:
         # Extract additional terms from high-scoring results
         additional_terms = set()
 
-        for result in results[:3]:  # Use top 3 results
+        for result in results[:EXPANSION_SOURCE_RESULTS]:
             mesh_terms = result.get("mesh_terms", [])
             additional_terms.update([term.lower() for term in mesh_terms[:5]])
 
@@ -591,22 +1104,26 @@ class VectorSearch:
 
     def _ensure_result_diversity(self, results: List[Dict]) -> List[Dict]:
         """Ensure diversity in search results."""
-        diverse_results = []
         seen_sources = set()
+        seen_results = set()
+        diverse_results = []
+        remaining_results = []
 
-        # First pass: one result per unique source
+        # One result per unique source first, then the remaining results in
+        # their original order; results are compared by identity
         for result in results:
+            if id(result) in seen_results:
+                continue
+            seen_results.add(id(result))
+
             source = result.get("source", "")
             if source not in seen_sources:
-                diverse_results.append(result)
                 seen_sources.add(source)
-
-        # Second pass: add remaining high-scoring results
-        for result in results:
-            if result not in diverse_results and len(diverse_results) < len(results):
                 diverse_results.append(result)
+            else:
+                remaining_results.append(result)
 
-        return diverse_results
+        return diverse_results + remaining_results
 
     def _apply_final_medical_scoring(
         self, results: List[Dict], medications: List[str], patient_info: Dict
@@ -678,8 +1195,7 @@ class VectorSearch:
         return min(2.0, relevance)  # Cap at 2.0
 
     def search_by_condition(self, condition: str, k: int = None) -> List[Dict]:
-        query = f"{condition} treatment management therapy medication guidelines"
-        return self.search(query, k)
+        return self._search_template("condition", condition, k)
 
     def search_by_medical_condition(
         self, condition: str, symptoms: List[str] = None, k: int = None
@@ -689,22 +1205,8 @@ class VectorSearch:
         if symptoms:
             query_parts.extend(symptoms)
 
-        # Add general medical terms
-        query_parts.extend(
-            [
-                "treatment",
-                "management",
-                "therapy",
-                "diagnosis",
-                "clinical",
-                "patient",
-                "symptoms",
-                "prevention",
-            ]
-        )
-
-        query = " ".join(query_parts)
-        return self.search(query, k)
+        # General medical terms come from the precomputed template
+        return self._search_template("medical_condition", " ".join(query_parts), k)
 
     def search_by_symptoms(self, symptoms: List[str], k: int = None) -> List[Dict]:
         """Search for documents based on symptoms.
@@ -716,22 +1218,7 @@ class VectorSearch:
         Returns:
             List of relevant documents
         """
-        query_parts = symptoms.copy()
-        query_parts.extend(
-            [
-                "symptoms",
-                "diagnosis",
-                "clinical",
-                "manifestation",
-                "signs",
-                "presentation",
-                "condition",
-                "disease",
-            ]
-        )
-
-        query = " ".join(query_parts)
-        return self.search(query, k)
+        return self._search_template("symptoms", " ".join(symptoms), k)
 
     def search_by_treatment(self, treatment_type: str, k: int = None) -> List[Dict]:
         """Search for documents related to specific treatments.
@@ -743,26 +1230,34 @@ class VectorSearch:
         Returns:
             List of relevant documents
         """
-        query = f"{treatment_type} treatment therapy intervention protocol management clinical guidelines"
-        return self.search(query, k)
+        return self._search_template("treatment", treatment_type, k)
+
+    def _build_id_index(self, ids: Optional[List[str]] = None) -> None:
+        """Map document ids to positions, keeping the first of any duplicates."""
+        if ids is None:
+            ids = [doc.get("id") for doc in self.documents]
+        self._id_index = {}
+        for i, doc_id in enumerate(ids):
+            self._id_index.setdefault(doc_id, i)
 
     def get_document_by_id(self, doc_id: str) -> Optional[Dict]:
-        for doc in self.documents:
-            if doc.get("id") == doc_id:
-                return doc
-        return None
+        i = self._id_index.get(doc_id)
+        return self.documents[i] if i is not None else None
 
     def get_stats(self) -> Dict:
         stats = {
             "total_documents": len(self.documents),
             "model_name": self.model_name,
             "index_loaded": self.index is not None,
-            "embedding_dimension": self.embeddings.shape[1]
-            if self.embeddings is not None
-            else 0,
+            "embedding_dimension": self.index.d if self.index is not None else 0,
         }
 
-        if self.documents:
+        if isinstance(self.documents, DocumentTable):
+            if len(self.documents):
+                stats["source_types"] = self.documents.value_counts(
+                    "source_type", "unknown"
+                )
+        elif self.documents:
             source_types = {}
             for doc in self.documents:
                 source_type = doc.get("source_type", "unknown")
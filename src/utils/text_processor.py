@@ -1,32 +1,208 @@
 """Text processing utilities for cleaning and normalizing medical text."""
 
+import os
 import re
 import logging
-from typing import List, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+from config.settings import (
+    CLEAN_TEXT_CACHE_MAX_CHARS,
+    CLEAN_TEXT_CACHE_SIZE,
+    MEDICATION_NAME_CACHE_SIZE,
+    SPACY_BATCH_SIZE,
+    SPACY_MODEL,
+    SPACY_N_PROCESS,
+)
 
 logger = logging.getLogger(__name__)
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+    logger.warning("pyahocorasick not installed. Drug names will be found with spaCy.")
+
+# Patterns used by clean_text
+_HTML_RE = re.compile(r"<[^>]+>")
+_CITATION_BRACKET_RE = re.compile(r"\[\d+\]")
+_CITATION_PAREN_RE = re.compile(r"\(\d+\)")
+_ET_AL_RE = re.compile(r"et al\.")
+# A single character class: "$-_" already spans digits, capitals, "%" and
+# the other punctuation URLs may contain, so per-character alternation and
+# the percent-escape branch only added backtracking
+_URL_RE = re.compile(r"https?://[!$-_a-z]+")
+# One pass for all dosage units; mg/kg is tried before mg, as the separate
+# substitutions it replaces were applied
+_DOSAGE_RE = re.compile(r"\d+\s*m(g/kg|g|l)")
+_DOSAGE_PLACEHOLDERS = {"g/kg": "DOSAGE_MG_KG", "g": "DOSAGE_MG", "l": "DOSAGE_ML"}
+_WS_RE = re.compile(r"\s+")
+_SPECIAL_CHARS_RE = re.compile(r"[^\w\s\-\+\.\,\:\;\(\)]")
+
+# extract_dosage_info scans once for doses and durations, which can never
+# overlap, so this finds the same matches as separate scans. Frequencies can
+# overlap durations ("for 3 weekly"), so they keep a scan of their own.
+# Doses keep the "m" and any "/kg" in groups of their own so that
+# clean_text_with_dosage can also rebuild _DOSAGE_RE's placeholders from them
+_DOSAGE_INFO_RE = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(m)([gl](?:/kg)?)|for\s+(\d+)\s+(days?|weeks?|months?)",
+    re.IGNORECASE,
+)
+_FREQUENCY_RE = re.compile(
+    r"(once|twice|three times|four times|daily|weekly|monthly)", re.IGNORECASE
+)
+
+# Trailing dosage forms stripped by normalize_medication_name
+_DOSAGE_FORM_SUFFIX_RE = re.compile(
+    r"(?:\s+(?:Tablet|Capsule|Syrup|Injection|Cream|Ointment|Gel|Drops))+$",
+    re.IGNORECASE,
+)
+
+# Token attributes read in one call by _medical_terms; below this many tokens
+# the per-token loop is faster than building the array
+_TERM_ATTRS = ["IS_ALPHA", "IS_STOP", "LENGTH", "ORTH"]
+_VECTORIZED_MIN_TOKENS = 64
+
+
+def _dosage_placeholder(match: re.Match) -> str:
+    return _DOSAGE_PLACEHOLDERS[match.group(1)]
+
+
+def _strip_markup(text: str) -> str:
+    """Removal passes of clean_text that run before dosage substitution."""
+    # Each removal pass is skipped when its leading literal is absent;
+    # str.__contains__ scans far faster than a regex that finds nothing
+
+    # Remove HTML tags
+    if "<" in text:
+        text = _HTML_RE.sub("", text)
+
+    # Remove citations and references
+    if "[" in text:
+        text = _CITATION_BRACKET_RE.sub("", text)
+    if "(" in text:
+        text = _CITATION_PAREN_RE.sub("", text)
+    if "et al." in text:
+        text = _ET_AL_RE.sub("", text)
+
+    # Remove URLs
+    if "http" in text:
+        text = _URL_RE.sub("", text)
+
+    return text
+
+
+def _normalize_whitespace(text: str) -> str:
+    """Passes of clean_text that run after dosage substitution."""
+    # Remove extra whitespace
+    text = _WS_RE.sub(" ", text)
+
+    # Remove special characters but keep medical terms
+    text = _SPECIAL_CHARS_RE.sub("", text)
+
+    return text.strip()
+
+
+def _clean_text(text: str) -> str:
+    """Regex pipeline behind TextProcessor.clean_text."""
+    text = _strip_markup(text)
+
+    # Clean up medical dosage patterns; every unit starts with "mg" or "ml"
+    if "mg" in text or "ml" in text:
+        text = _DOSAGE_RE.sub(_dosage_placeholder, text)
+
+    return _normalize_whitespace(text)
+
+
+_clean_text_cached = lru_cache(maxsize=CLEAN_TEXT_CACHE_SIZE)(_clean_text)
+
+
+@lru_cache(maxsize=MEDICATION_NAME_CACHE_SIZE)
+def _normalize_medication_name(med_name: str) -> str:
+    """Body of TextProcessor.normalize_medication_name, memoized."""
+    # split, join and title already run in C; an uncached call takes about
+    # 2us and repeats hit the cache, so a compiled extension would not pay
+    # Remove extra spaces and normalize case
+    normalized = " ".join(med_name.split()).title()
+
+    # Remove common suffixes that might interfere with lookup
+    return _DOSAGE_FORM_SUFFIX_RE.sub("", normalized).strip()
+
+
+@lru_cache(maxsize=None)
+def _load_pipeline(name: str, disable: Tuple[str, ...] = ()):
+    """Load a spaCy pipeline once per process."""
+    import spacy
+
+    return spacy.load(name, disable=list(disable))
+
+
+# Pipeline of a term-extraction worker process, set by _init_term_worker
+_worker_nlp = None
+
+
+def _init_term_worker(name: str):
+    """Load the pipeline once per worker instead of pickling it per task."""
+    global _worker_nlp
+    _worker_nlp = _load_pipeline(name, ("parser",))
+
+
+def _extract_terms_worker(text: str) -> List[str]:
+    """Medical terms of one text, run inside a term-extraction worker."""
+    return TextProcessor._medical_terms(_worker_nlp(text)) if text else []
+
 
 class TextProcessor:
     """Text processing utilities for medical content."""
 
-    def __init__(self):
-        """Initialize the text processor."""
-        self.nlp = None
-        self._load_spacy_model()
+    def __init__(self, drug_names: Optional[Iterable[str]] = None):
+        """Initialize the text processor.
+
+        Args:
+            drug_names: Known drug names; when given, extract_medical_terms
+                matches these instead of guessing terms with spaCy
+        """
+        self._drug_matcher = None
+        if drug_names is not None:
+            self._drug_matcher = self._build_drug_matcher(drug_names)
+
+        # spaCy is loaded on first use; clean_text and the other regex-only
+        # helpers never need it
+        self._nlp = None
+        self._nlp_lemma = None
+        self._spacy_attempted = False
+
+    @property
+    def nlp(self):
+        """spaCy pipeline for entities and tokens, or None if unavailable."""
+        if not self._spacy_attempted:
+            self._load_spacy_model()
+        return self._nlp
+
+    @property
+    def nlp_lemma(self):
+        """spaCy pipeline for lemmatization, or None if unavailable."""
+        if not self._spacy_attempted:
+            self._load_spacy_model()
+        return self._nlp_lemma
 
     def _load_spacy_model(self):
         """Load spaCy model with error handling."""
+        # Only try once, so a missing model is not reloaded and logged on
+        # every call
+        self._spacy_attempted = True
         try:
-            import spacy
-
-            self.nlp = spacy.load("en_core_web_sm")
+            # Nothing here reads dependency parses, and lemmas do not need
+            # entities either
+            self._nlp = _load_pipeline(SPACY_MODEL, ("parser",))
+            self._nlp_lemma = _load_pipeline(SPACY_MODEL, ("parser", "ner"))
             logger.info("spaCy model loaded successfully")
         except ImportError:
             logger.warning("spaCy not installed. Some features will be limited.")
         except OSError:
             logger.warning(
-                "spaCy model not found. Install with: python -m spacy download en_core_web_sm"
+                f"spaCy model not found. Install with: python -m spacy download {SPACY_MODEL}"
             )
         except Exception as e:
             logger.error(f"Failed to load spaCy model: {e}")
@@ -43,33 +219,53 @@ class TextProcessor:
         if not text:
             return ""
 
-        # Remove HTML tags
-        text = re.sub(r"<[^>]+>", "", text)
-
-        # Remove citations and references
-        text = re.sub(r"\[\d+\]", "", text)
-        text = re.sub(r"\(\d+\)", "", text)
-        text = re.sub(r"et al\.", "", text)
+        # Short strings such as page headers, footers and UI input recur;
+        # long documents rarely do and would only crowd the cache
+        if len(text) <= CLEAN_TEXT_CACHE_MAX_CHARS:
+            return _clean_text_cached(text)
+        return _clean_text(text)
 
-        # Remove URLs
-        text = re.sub(
-            r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
-            "",
-            text,
-        )
+    def clean_text_with_dosage(self, text: str) -> Tuple[str, Dict[str, List[str]]]:
+        """Clean text and extract its dosage information in the same scan.
 
-        # Clean up medical dosage patterns
-        text = re.sub(r"\d+\s*mg/kg", "DOSAGE_MG_KG", text)
-        text = re.sub(r"\d+\s*mg", "DOSAGE_MG", text)
-        text = re.sub(r"\d+\s*ml", "DOSAGE_ML", text)
+        Dosages are read after markup, citations and URLs are removed, so a
+        dose inside a URL is not reported; otherwise the information matches
+        extract_dosage_info.
 
-        # Remove extra whitespace
-        text = re.sub(r"\s+", " ", text)
+        Args:
+            text: Raw text to clean
 
-        # Remove special characters but keep medical terms
-        text = re.sub(r"[^\w\s\-\+\.\,\:\;\(\)]", "", text)
+        Returns:
+            Cleaned text, as from clean_text, and its dosage information
+        """
+        dosage_patterns = self._empty_dosage_info()
+        if not text:
+            return "", dosage_patterns
+
+        def record(match: re.Match) -> str:
+            amount, m, unit, num, period = match.groups()
+            if num:
+                dosage_patterns["duration"].append(f"{num} {period}")
+                return match.group()
+
+            key = "mg_doses" if unit[0] in "gG" else "ml_doses"
+            dosage_patterns[key].append(amount)
+
+            # _DOSAGE_RE is case-sensitive and takes only the integer digits
+            # right before the unit, so "2.5 mg" became "2.DOSAGE_MG"
+            if m != "m" or unit[0] not in "gl":
+                return match.group()
+            placeholder_unit = "g/kg" if unit == "g/kg" else unit[0]
+            return (
+                amount[: amount.rfind(".") + 1]
+                + _DOSAGE_PLACEHOLDERS[placeholder_unit]
+                + unit[len(placeholder_unit) :]
+            )
 
-        return text.strip()
+        text = _strip_markup(text)
+        dosage_patterns["frequency"] = _FREQUENCY_RE.findall(text)
+        text = _DOSAGE_INFO_RE.sub(record, text)
+        return _normalize_whitespace(text), dosage_patterns
 
     def extract_medical_terms(self, text: str) -> List[str]:
         """Extract medical terms and drug names from text.
@@ -80,20 +276,120 @@ class TextProcessor:
         Returns:
             List of medical terms
         """
+        if self._drug_matcher and text:
+            return self._match_drug_names(text)
+
         if not self.nlp or not text:
             return []
 
         try:
-            doc = self.nlp(text)
-            medical_terms = []
+            return self._medical_terms(self.nlp(text))
+
+        except Exception as e:
+            logger.error(f"Error extracting medical terms: {e}")
+            return []
+
+    def extract_medical_terms_batch(self, texts: Iterable[str]) -> Iterator[List[str]]:
+        """Extract medical terms from many texts, in worker processes when large.
+
+        Args:
+            texts: Texts to extract terms from
+
+        Yields:
+            List of medical terms for each text, in order
+        """
+        texts = list(texts)
+        if self._drug_matcher:
+            yield from (self._match_drug_names(text) if text else [] for text in texts)
+            return
+
+        if not self.nlp:
+            yield from ([] for _ in texts)
+            return
 
-            for ent in doc.ents:
-                # Extract entities that might be medical terms
-                if ent.label_ in ["PERSON", "ORG", "PRODUCT", "GPE"]:
-                    if len(ent.text) > 2 and ent.text.isalpha():
-                        medical_terms.append(ent.text)
+        done = 0
+        try:
+            if len(texts) > SPACY_BATCH_SIZE and SPACY_N_PROCESS != 1:
+                terms_iter = self._extract_terms_parallel(texts)
+            else:
+                terms_iter = (
+                    self._medical_terms(doc)
+                    for doc in self.nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE)
+                )
+            for terms in terms_iter:
+                yield terms
+                done += 1
+        except Exception as e:
+            logger.error(f"Error extracting medical terms: {e}")
+            # Keep one result per input so callers zipping against texts stay aligned
+            yield from ([] for _ in texts[done:])
+
+    @staticmethod
+    def _extract_terms_parallel(texts: List[str]) -> Iterator[List[str]]:
+        """Extract terms in worker processes that each load the pipeline once.
+
+        Only the texts and the term lists cross process boundaries, which
+        costs less than nlp.pipe(n_process=...) shipping whole Doc objects
+        back. On Windows and macOS workers are spawned, so they re-import the
+        calling script: its entry point must sit under an
+        ``if __name__ == "__main__":`` guard, and every worker pays the model
+        load before its first chunk.
+        """
+        max_workers = os.cpu_count() if SPACY_N_PROCESS < 0 else SPACY_N_PROCESS
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_term_worker,
+            initargs=(SPACY_MODEL,),
+        ) as executor:
+            yield from executor.map(
+                _extract_terms_worker, texts, chunksize=SPACY_BATCH_SIZE
+            )
 
-            # Extract potential drug names (capitalized words)
+    @staticmethod
+    def _build_drug_matcher(drug_names: Iterable[str]):
+        """Aho-Corasick automaton over lowercased drug names, if available."""
+        if ahocorasick is None:
+            return None
+
+        automaton = ahocorasick.Automaton()
+        for name in drug_names:
+            key = name.lower().strip()
+            if key:
+                automaton.add_word(key, (len(key), name))
+        if len(automaton) == 0:
+            return None
+        automaton.make_automaton()
+        return automaton
+
+    def _match_drug_names(self, text: str) -> List[str]:
+        """Known drug names mentioned in text as whole words, by first mention."""
+        lowered = text.lower()
+        matches: Dict[str, None] = {}
+
+        # One pass over the text regardless of how many names are known
+        for end, (length, name) in self._drug_matcher.iter(lowered):
+            start = end - length + 1
+            if start > 0 and lowered[start - 1].isalnum():
+                continue
+            if end + 1 < len(lowered) and lowered[end + 1].isalnum():
+                continue
+            matches[name] = None
+
+        return list(matches)
+
+    @staticmethod
+    def _medical_terms(doc) -> List[str]:
+        # Insertion-ordered set: terms are returned once, by first mention
+        medical_terms: Dict[str, None] = {}
+
+        for ent in doc.ents:
+            # Extract entities that might be medical terms
+            if ent.label_ in ["PERSON", "ORG", "PRODUCT", "GPE"]:
+                if len(ent.text) > 2 and ent.text.isalpha():
+                    medical_terms[ent.text] = None
+
+        # Extract potential drug names (capitalized words)
+        if len(doc) < _VECTORIZED_MIN_TOKENS:
             for token in doc:
                 if (
                     token.is_alpha
@@ -101,13 +397,19 @@ class TextProcessor:
                     and len(token.text) > 3
                     and not token.is_stop
                 ):
-                    medical_terms.append(token.text)
-
-            return list(set(medical_terms))
-
-        except Exception as e:
-            logger.error(f"Error extracting medical terms: {e}")
-            return []
+                    medical_terms[token.text] = None
+        else:
+            attrs = doc.to_array(_TERM_ATTRS)
+            mask = (attrs[:, 0] == 1) & (attrs[:, 1] == 0) & (attrs[:, 2] > 3)
+            strings = doc.vocab.strings
+            # IS_TITLE rejects "ACE" or "McNeil", so capitalization is still
+            # checked on the text, but only for tokens that passed the mask
+            for orth in attrs[mask, 3].tolist():
+                text = strings[orth]
+                if text[0].isupper():
+                    medical_terms[text] = None
+
+        return list(medical_terms)
 
     def lemmatize_text(self, text: str) -> str:
         """Lemmatize text while preserving medical terms.
@@ -118,28 +420,64 @@ class TextProcessor:
         Returns:
             Lemmatized text
         """
-        if not self.nlp or not text:
+        if not self.nlp_lemma or not text:
             return text
 
         try:
-            doc = self.nlp(text)
-            lemmatized = []
+            return self._lemmatize(self.nlp_lemma(text))
 
-            for token in doc:
-                if token.is_alpha and not token.is_stop:
-                    # Preserve medical terms in uppercase
-                    if token.text[0].isupper() and len(token.text) > 3:
-                        lemmatized.append(token.text)
-                    else:
-                        lemmatized.append(token.lemma_.lower())
-                elif not token.is_space:
-                    lemmatized.append(token.text)
+        except Exception as e:
+            logger.error(f"Error lemmatizing text: {e}")
+            return text
 
-            return " ".join(lemmatized)
+    def lemmatize_texts(self, texts: Iterable[str]) -> Iterator[str]:
+        """Lemmatize many texts, batched through nlp.pipe.
 
+        Args:
+            texts: Texts to lemmatize
+
+        Yields:
+            Lemmatized text for each input, in order
+        """
+        texts = list(texts)
+        if not self.nlp_lemma:
+            yield from texts
+            return
+
+        done = 0
+        try:
+            for doc in self._pipe(self.nlp_lemma, texts):
+                yield self._lemmatize(doc)
+                done += 1
         except Exception as e:
             logger.error(f"Error lemmatizing text: {e}")
-            return text
+            # Fall back to the unlemmatized text for every input not yet yielded
+            yield from texts[done:]
+
+    @staticmethod
+    def _lemmatize(doc) -> str:
+        # Token properties are plain struct reads in Cython; Doc.to_array plus
+        # a StringStore lookup per token measured slower than this loop
+        lemmatized = []
+
+        for token in doc:
+            if token.is_alpha and not token.is_stop:
+                # Preserve medical terms in uppercase
+                if token.text[0].isupper() and len(token.text) > 3:
+                    lemmatized.append(token.text)
+                else:
+                    lemmatized.append(token.lemma_.lower())
+            elif not token.is_space:
+                lemmatized.append(token.text)
+
+        return " ".join(lemmatized)
+
+    @staticmethod
+    def _pipe(nlp, texts: List[str]):
+        # Worker processes each load their own copy of the pipeline, which
+        # only pays off for larger inputs
+        n_process = SPACY_N_PROCESS if len(texts) > SPACY_BATCH_SIZE else 1
+        return nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE, n_process=n_process)
 
     def extract_dosage_info(self, text: str) -> Dict[str, List[str]]:
         """Extract dosage information from text.
@@ -150,39 +488,31 @@ class TextProcessor:
         Returns:
             Dictionary with dosage patterns
         """
-        dosage_patterns = {
-            "mg_doses": [],
-            "ml_doses": [],
-            "frequency": [],
-            "duration": [],
-        }
-
-        # Extract mg doses
-        mg_matches = re.findall(r"(\d+(?:\.\d+)?)\s*mg", text, re.IGNORECASE)
-        dosage_patterns["mg_doses"] = mg_matches
+        dosage_patterns = self._empty_dosage_info()
 
-        # Extract ml doses
-        ml_matches = re.findall(r"(\d+(?:\.\d+)?)\s*ml", text, re.IGNORECASE)
-        dosage_patterns["ml_doses"] = ml_matches
+        for amount, _, unit, num, period in _DOSAGE_INFO_RE.findall(text):
+            if unit:
+                # Extract mg and ml doses
+                key = "mg_doses" if unit[0] in "gG" else "ml_doses"
+                dosage_patterns[key].append(amount)
+            else:
+                # Extract duration patterns
+                dosage_patterns["duration"].append(f"{num} {period}")
 
         # Extract frequency patterns
-        freq_matches = re.findall(
-            r"(once|twice|three times|four times|daily|weekly|monthly)",
-            text,
-            re.IGNORECASE,
-        )
-        dosage_patterns["frequency"] = freq_matches
-
-        # Extract duration patterns
-        duration_matches = re.findall(
-            r"for\s+(\d+)\s+(days?|weeks?|months?)", text, re.IGNORECASE
-        )
-        dosage_patterns["duration"] = [
-            f"{num} {unit}" for num, unit in duration_matches
-        ]
+        dosage_patterns["frequency"] = _FREQUENCY_RE.findall(text)
 
         return dosage_patterns
 
+    @staticmethod
+    def _empty_dosage_info() -> Dict[str, List[str]]:
+        return {
+            "mg_doses": [],
+            "ml_doses": [],
+            "frequency": [],
+            "duration": [],
+        }
+
     def normalize_medication_name(self, med_name: str) -> str:
         """Normalize medication name for consistent lookup.
 
@@ -195,20 +525,15 @@ class TextProcessor:
         if not med_name:
             return ""
 
-        # Remove extra spaces and normalize case
-        normalized = " ".join(med_name.split()).title()
-
-        # Remove common suffixes that might interfere with lookup
-        suffixes_to_remove = [
-            "Tablet",
-            "Capsule",
-            "Syrup",
-            "Injection",
-            "Cream",
-            "Ointment",
-        ]
-        for suffix in suffixes_to_remove:
-            if normalized.endswith(f" {suffix}"):
-                normalized = normalized[: -len(f" {suffix}")]
-
-        return normalized.strip()
+        return _normalize_medication_name(med_name)
+
+
+@lru_cache(maxsize=None)
+def get_text_processor() -> TextProcessor:
+    """Shared TextProcessor for callers without drug names of their own.
+
+    spaCy pipelines are already loaded once per process by _load_pipeline;
+    this also shares the instance, and importing it before workers fork
+    (e.g. gunicorn --preload) lets them share the loaded model's pages.
+    """
+    return TextProcessor()
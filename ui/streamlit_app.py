@@ -1,18 +1,20 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-import markdown
-from bs4 import BeautifulSoup
-from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-from typing import Dict
+from typing import Dict, List
 from dataclasses import dataclass
 from datetime import datetime
+from pathlib import Path
 import io
+import orjson
 
 # Configure page
 st.set_page_config(
@@ -22,362 +24,19 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Simple and robust CSS styling
-st.markdown("""
-<style>
-/* === GLOBAL THEME === */
-.stApp {
-    background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%) !important;
-    color: white !important;
-}
+# Simple and robust CSS styling, kept in a static sheet next to this script
+@st.cache_data
+def load_css() -> str:
+    """Read the stylesheet once instead of rebuilding it on every rerun.
 
-/* === HIDE STREAMLIT ELEMENTS === */
-#MainMenu, footer, header, .stDeployButton { display: none !important; }
+    Streamlit drops any element a rerun does not emit again, so the sheet is
+    resent on every rerun; comments and indentation are stripped to shrink it.
+    """
+    css = Path(__file__).with_name("style.css").read_text(encoding="utf-8")
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    return re.sub(r'\s+', ' ', css).strip()
 
-/* === LAYOUT === */
-.main .block-container {
-    max-width: 1200px !important;
-    padding: 1rem !important;
-}
-
-/* === CUSTOM COMPONENTS === */
-.medical-header {
-    background: rgba(30, 41, 59, 0.9);
-    padding: 1.5rem;
-    border-radius: 12px;
-    margin-bottom: 2rem;
-    border: 1px solid rgba(59, 130, 246, 0.3);
-}
-
-.custom-card {
-    background: rgba(30, 41, 59, 0.9) !important;
-    border: 1px solid rgba(59, 130, 246, 0.3) !important;
-    border-radius: 12px !important;
-    padding: 2rem !important;
-    margin: 1rem 0 !important;
-}
-
-/* === STEP INDICATOR === */
-.step-indicator {
-    display: flex;
-    justify-content: center;
-    gap: 2rem;
-    margin: 2rem 0;
-}
-
-.step-number {
-    width: 3rem;
-    height: 3rem;
-    border-radius: 50%;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-weight: bold;
-    color: white;
-}
-
-.step-completed { background: #10b981; }
-.step-current { background: #3b82f6; }
-.step-pending { background: #374151; border: 2px solid #6b7280; }
-
-.step-connector {
-    width: 3rem;
-    height: 3px;
-    background: #6b7280;
-    margin-top: 1.5rem;
-}
-.step-connector.completed { background: #10b981; }
-
-/* === INPUTS === */
-.stTextInput input, .stNumberInput input, .stTextArea textarea {
-    background: rgba(30, 41, 59, 0.9) !important;
-    color: white !important;
-    border: 2px solid rgba(59, 130, 246, 0.3) !important;
-    border-radius: 8px !important;
-}
-
-.stTextInput input:focus, .stNumberInput input:focus, .stTextArea textarea:focus {
-    border-color: #3b82f6 !important;
-    box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.2) !important;
-}
-
-/* === BUTTONS === */
-.stButton button {
-    background: #3b82f6 !important;
-    color: white !important;
-    border: none !important;
-    border-radius: 8px !important;
-    padding: 0.75rem 1.5rem !important;
-    font-weight: 600 !important;
-    transition: all 0.2s !important;
-}
-
-.stButton button:hover {
-    background: #2563eb !important;
-    transform: translateY(-2px) !important;
-    box-shadow: 0 4px 12px rgba(59, 130, 246, 0.4) !important;
-}
-
-/* === MEDICATION COMPONENTS === */
-.medication-item {
-    background: rgba(30, 41, 59, 0.8);
-    border: 1px solid rgba(59, 130, 246, 0.3);
-    border-radius: 8px;
-    padding: 1.5rem;
-    margin: 1rem 0;
-}
-
-.dosage-item {
-    background: rgba(59, 130, 246, 0.1);
-    border-radius: 8px;
-    padding: 1rem;
-    text-align: center;
-    margin-bottom: 1rem;
-}
-
-/* === DOSE CONTROLS === */
-.dosage-controls button {
-    height: 3.5rem !important;
-    font-size: 2rem !important;
-    font-weight: 900 !important;
-    border-radius: 8px !important;
-    border: 3px solid !important;
-}
-
-/* Decrease button - Red */
-.dosage-controls > div:first-child button {
-    background: #dc2626 !important;
-    border-color: #b91c1c !important;
-    color: white !important;
-}
-
-/* Increase button - Green */
-.dosage-controls > div:last-child button {
-    background: #059669 !important;
-    border-color: #047857 !important;
-    color: white !important;
-}
-
-.dose-value {
-    background: rgba(30, 41, 59, 0.9) !important;
-    border: 3px solid #3b82f6 !important;
-    border-radius: 8px !important;
-    color: white !important;
-    font-size: 1.5rem !important;
-    font-weight: bold !important;
-    height: 3.5rem !important;
-    display: flex !important;
-    align-items: center !important;
-    justify-content: center !important;
-    font-family: monospace !important;
-}
-
-/* === CHAT INTERFACE === */
-.chat-container {
-    max-height: 70vh;
-    overflow-y: auto;
-    padding: 1rem;
-}
-
-.user-message {
-    background: rgba(59, 130, 246, 0.2);
-    border: 1px solid rgba(59, 130, 246, 0.5);
-    border-radius: 12px;
-    padding: 1rem;
-    margin: 1rem 0 1rem 20%;
-}
-
-.assistant-message {
-    background: rgba(16, 185, 129, 0.2);
-    border: 1px solid rgba(16, 185, 129, 0.5);
-    border-radius: 12px;
-    padding: 1rem;
-    margin: 1rem 20% 1rem 0;
-}
-
-/* === IMPROVED TEXT FORMATTING === */
-.formatted-content {
-    line-height: 1.6 !important;
-    font-size: 0.95rem !important;
-}
-
-.formatted-content h1, .formatted-content h2 {
-    color: #3b82f6 !important;
-    margin: 1.5rem 0 1rem 0 !important;
-    font-weight: 600 !important;
-    border-bottom: 2px solid rgba(59, 130, 246, 0.3) !important;
-    padding-bottom: 0.5rem !important;
-}
-
-.formatted-content h1 {
-    font-size: 1.4rem !important;
-}
-
-.formatted-content h2 {
-    font-size: 1.2rem !important;
-}
-
-.formatted-content h3, .formatted-content h4 {
-    color: #10b981 !important;
-    margin: 1.2rem 0 0.8rem 0 !important;
-    font-weight: 500 !important;
-    font-size: 1.1rem !important;
-}
-
-.formatted-content p {
-    margin: 0.8rem 0 !important;
-    text-align: justify !important;
-}
-
-.formatted-content ul, .formatted-content ol {
-    margin: 0.8rem 0 !important;
-    padding-left: 1.5rem !important;
-}
-
-.formatted-content li {
-    margin: 0.4rem 0 !important;
-    line-height: 1.5 !important;
-}
-
-.formatted-content strong {
-    color: #fbbf24 !important;
-    font-weight: 600 !important;
-}
-
-.formatted-content em {
-    color: #a78bfa !important;
-    font-style: italic !important;
-}
-
-.formatted-content table {
-    width: 100% !important;
-    border-collapse: collapse !important;
-    margin: 1rem 0 !important;
-    background: rgba(30, 41, 59, 0.5) !important;
-}
-
-.formatted-content th, .formatted-content td {
-    border: 1px solid rgba(59, 130, 246, 0.3) !important;
-    padding: 0.5rem !important;
-    text-align: left !important;
-}
-
-.formatted-content th {
-    background: rgba(59, 130, 246, 0.2) !important;
-    font-weight: 600 !important;
-}
-
-/* === STREAMLIT MARKDOWN TABLES === */
-.stMarkdown table {
-    width: 100% !important;
-    border-collapse: collapse !important;
-    margin: 1rem 0 !important;
-    background: rgba(30, 41, 59, 0.5) !important;
-    color: white !important;
-}
-
-.stMarkdown th, .stMarkdown td {
-    border: 1px solid rgba(59, 130, 246, 0.3) !important;
-    padding: 0.75rem !important;
-    text-align: left !important;
-    color: white !important;
-}
-
-.stMarkdown th {
-    background: rgba(59, 130, 246, 0.2) !important;
-    font-weight: 600 !important;
-}
-
-.stMarkdown tbody tr:nth-child(even) {
-    background: rgba(30, 41, 59, 0.3) !important;
-}
-
-.stMarkdown tbody tr:hover {
-    background: rgba(59, 130, 246, 0.1) !important;
-}
-
-/* === SECTION SPACING === */
-.content-section {
-    margin: 1rem 0 !important;
-    padding: 0 !important;
-}
-
-.section-spacing {
-    margin-bottom: 0.5rem !important;
-}
-
-.message-metadata {
-    display: grid;
-    grid-template-columns: repeat(auto-fit, minmax(120px, 1fr));
-    gap: 0.5rem;
-    margin-top: 1rem;
-    padding-top: 1rem;
-    border-top: 1px solid rgba(255, 255, 255, 0.1);
-    font-size: 0.8rem;
-    text-align: center;
-}
-
-/* === SIDEBAR === */
-.sidebar-section {
-    background: rgba(30, 41, 59, 0.8);
-    border: 1px solid rgba(59, 130, 246, 0.3);
-    border-radius: 8px;
-    padding: 1rem;
-    margin: 1rem 0;
-}
-
-/* === DISCLAIMER === */
-.compact-disclaimer {
-    background: rgba(239, 68, 68, 0.1);
-    border: 1px solid rgba(239, 68, 68, 0.3);
-    border-radius: 8px;
-    padding: 1rem;
-    margin: 2rem 0;
-    text-align: center;
-    color: #fca5a5;
-    font-size: 0.9rem;
-}
-
-/* === ANIMATIONS === */
-.loading-dots {
-    display: flex;
-    gap: 0.25rem;
-    align-items: center;
-}
-
-.loading-dot {
-    width: 8px;
-    height: 8px;
-    border-radius: 50%;
-    background: #3b82f6;
-    animation: bounce 1.4s infinite ease-in-out both;
-}
-
-.loading-dot:nth-child(1) { animation-delay: -0.32s; }
-.loading-dot:nth-child(2) { animation-delay: -0.16s; }
-
-@keyframes bounce {
-    0%, 80%, 100% { transform: scale(0); opacity: 0.3; }
-    40% { transform: scale(1); opacity: 1; }
-}
-
-@keyframes pulse {
-    0%, 100% { opacity: 1; }
-    50% { opacity: 0.5; }
-}
-
-/* === OVERRIDES === */
-[data-testid="stSidebar"] {
-    background: rgba(15, 23, 42, 0.95) !important;
-}
-
-/* Force dark theme on any remaining white elements */
-div[style*="background-color: white"], 
-div[style*="background: white"] {
-    background: rgba(30, 41, 59, 0.8) !important;
-}
-</style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
 
 @dataclass
 class PatientInfo:
@@ -392,10 +51,84 @@ class Medication:
     noon: float
     night: float
 
+def format_schedule(med: Medication) -> str:
+    """Dose schedule in the API's morning+noon+night form, e.g. "1+0+0.5"."""
+    return f"{med.morning}+{med.noon}+{med.night}"
+
+def format_schedule_detail(med: Medication) -> str:
+    """Non-zero doses by time of day for reports, e.g. "Morning: 1 | Night: 0.5"."""
+    schedule_parts = []
+    if med.morning > 0:
+        schedule_parts.append(f"Morning: {med.morning}")
+    if med.noon > 0:
+        schedule_parts.append(f"Noon: {med.noon}")
+    if med.night > 0:
+        schedule_parts.append(f"Night: {med.night}")
+    return " | ".join(schedule_parts)
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Pooled HTTP session for API calls.
+
+    Streamlit re-executes this script on every rerun, so a plain module-level
+    session would be rebuilt each time; cache_resource keeps one per process.
+    """
+    session = requests.Session()
+    # pool_connections counts per-host pools and only the API host is ever
+    # contacted; pool_maxsize bounds sockets kept alive for concurrent sessions
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=1, backoff_factor=0.1)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Shorter queries match too much of the drug database to be useful
+MIN_DRUG_QUERY_LENGTH = 3
+
+# Doses selectable with the +/- buttons, and each dose's position
+DOSE_OPTIONS = (0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5)
+DOSE_INDEX = {dose: i for i, dose in enumerate(DOSE_OPTIONS)}
+
+# Times of day with a dose, as (Medication field, label, icon)
+DOSE_PERIODS = (
+    ("morning", "Morning", "🌅"),
+    ("noon", "Noon", "☀️"),
+    ("night", "Night", "🌙")
+)
+
+@st.cache_data(ttl=300, max_entries=1024, show_spinner=False)
+def fetch_drug_suggestions(api_base_url: str, query: str) -> List[str]:
+    """Fetch drug name suggestions, shared across reruns and sessions.
+
+    Errors raise instead of returning [] so that failures are not cached.
+    """
+    response = get_http_session().get(
+        f"{api_base_url}/search_drugs",
+        params={"query": query, "limit": 5},
+        timeout=(1.0, 3.0)
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content).get("results", [])
+
+@st.cache_data(ttl=10, show_spinner=False)
+def fetch_api_health(api_base_url: str) -> bool:
+    """Check whether the API is up; the header shows this on every rerun.
+
+    The API runs next to the UI, so a refused or slow connection means it is
+    down and the header should not wait on it.
+    """
+    try:
+        response = get_http_session().get(f"{api_base_url}/health", timeout=(0.5, 1.0))
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
 class MedicalAdvisorApp:
     def __init__(self):
         self.api_base_url = "http://localhost:8000"
-        self.dose_options = [0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5]
         self.init_session_state()
     
     def init_session_state(self):
@@ -410,6 +143,8 @@ class MedicalAdvisorApp:
             'is_loading': False,
             'suggestions': {},
             'loading_suggestions': {},
+            'suggestion_queries': {},
+            'advice_report': None,
             'errors': {}
         }
         
@@ -445,34 +180,9 @@ class MedicalAdvisorApp:
         
         return content
     
-    def format_content_for_display(self, content: str) -> str:
-        """Format content for HTML display"""
-        cleaned_content = self.clean_and_format_content(content)
-        
-        # Convert markdown to HTML
-        html_content = markdown.markdown(
-            cleaned_content,
-            extensions=['tables', 'nl2br', 'fenced_code']
-        )
-        
-        # Clean up HTML with BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Add CSS classes for better styling
-        for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'ul', 'ol', 'table']):
-            existing_class = tag.get('class', [])
-            existing_class.append('formatted-content')
-            tag['class'] = existing_class
-        
-        return str(soup)
-
     def check_api_status(self):
         """Check if the API is available"""
-        try:
-            response = requests.get(f"{self.api_base_url}/health", timeout=2)
-            return response.status_code == 200
-        except:
-            return False
+        return fetch_api_health(self.api_base_url)
     
     def render_header(self):
         """Render header with API status indicator"""
@@ -641,14 +351,13 @@ class MedicalAdvisorApp:
                 
                 st.markdown(button_style, unsafe_allow_html=True)
                 
-                if st.button(f"Select {option}", key=f"gender_btn_{value}", use_container_width=True):
-                    selected_gender = value
-                    # Update the session state immediately
-                    if not st.session_state.patient_info:
-                        st.session_state.patient_info = PatientInfo(age=25, gender=value)
-                    else:
-                        st.session_state.patient_info.gender = value
-                    st.rerun()
+                st.button(
+                    f"Select {option}",
+                    key=f"gender_btn_{value}",
+                    use_container_width=True,
+                    on_click=self.select_gender,
+                    args=(value,)
+                )
         
         # Info box
         st.markdown("""
@@ -685,6 +394,17 @@ class MedicalAdvisorApp:
         
         st.markdown('</div>', unsafe_allow_html=True)
     
+    def select_gender(self, gender: str):
+        """Record the chosen gender.
+
+        Runs as a button callback, before the rerun the click triggers, so
+        the highlighted option is current without a second rerun.
+        """
+        if not st.session_state.patient_info:
+            st.session_state.patient_info = PatientInfo(age=25, gender=gender)
+        else:
+            st.session_state.patient_info.gender = gender
+    
     def render_medication_step(self):
         """Render medication input form"""
         st.markdown('<div class="custom-card">', unsafe_allow_html=True)
@@ -725,169 +445,12 @@ class MedicalAdvisorApp:
         
         # Render each medication
         for i, medication in enumerate(st.session_state.medications):
-            st.markdown(f'<div class="medication-item">', unsafe_allow_html=True)
-            
-            # Medication header
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.markdown(f"<h4>Medication {i + 1}</h4>", unsafe_allow_html=True)
-            
-            with col2:
-                if len(st.session_state.medications) > 1:
-                    if st.button("🗑️", key=f"delete_{medication.id}", help="Remove medication"):
-                        st.session_state.medications = [
-                            med for med in st.session_state.medications if med.id != medication.id
-                        ]
-                        if medication.id in st.session_state.suggestions:
-                            del st.session_state.suggestions[medication.id]
-                        st.rerun()
-            
-            # Medication name input with search
-            st.markdown("""
-            <div style="margin: 1rem 0;">
-                <label style="font-weight: 500; margin-bottom: 0.5rem; display: block;">Medication Name</label>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Create a text input for medication name
-            med_name = st.text_input(
-                "Medication Name",
-                value=medication.name,
-                key=f"med_name_{medication.id}",
-                placeholder="Type medication name...",
-                label_visibility="collapsed"
-            )
-            
-            # Update medication name in state if changed
-            if med_name != medication.name:
-                for j, med in enumerate(st.session_state.medications):
-                    if med.id == medication.id:
-                        st.session_state.medications[j] = Medication(
-                            id=med.id,
-                            name=med_name,
-                            morning=med.morning,
-                            noon=med.noon,
-                            night=med.night
-                        )
-                        # Trigger search for suggestions
-                        if len(med_name.strip()) >= 2:
-                            self.search_drugs(med_name, medication.id)
-                        break
-            
-            # Show suggestions if available
-            if medication.id in st.session_state.suggestions and st.session_state.suggestions[medication.id]:
-                st.markdown("**Suggestions:**")
-                cols = st.columns(min(3, len(st.session_state.suggestions[medication.id])))
-                for idx, suggestion in enumerate(st.session_state.suggestions[medication.id][:3]):
-                    with cols[idx]:
-                        if st.button(
-                            f"✓ {suggestion}",
-                            key=f"suggestion_{medication.id}_{suggestion}_{idx}",
-                            help="Click to select this medication",
-                            use_container_width=True
-                        ):
-                            # Update medication name
-                            for j, med in enumerate(st.session_state.medications):
-                                if med.id == medication.id:
-                                    st.session_state.medications[j] = Medication(
-                                        id=med.id,
-                                        name=suggestion,
-                                        morning=med.morning,
-                                        noon=med.noon,
-                                        night=med.night
-                                    )
-                                    break
-                            # Clear suggestions
-                            if medication.id in st.session_state.suggestions:
-                                del st.session_state.suggestions[medication.id]
-                            st.rerun()
-            
-            # Dosage schedule
-            st.markdown("""
-            <div style="margin: 1.5rem 0;">
-                <label style="font-weight: 500; margin-bottom: 1rem; display: block;">Daily Schedule</label>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            periods = [
-                {"key": "morning", "label": "Morning", "icon": "🌅"},
-                {"key": "noon", "label": "Noon", "icon": "☀️"},
-                {"key": "night", "label": "Night", "icon": "🌙"}
-            ]
-            
-            cols = st.columns(3)
-            for col, period in zip(cols, periods):
-                with col:
-                    current_dose = getattr(medication, period["key"])
-                    
-                    st.markdown(f"""
-                    <div class="dosage-item">
-                        <div style="font-size: 1.5rem; margin-bottom: 0.5rem;">{period["icon"]}</div>
-                        <div style="font-weight: 500; margin-bottom: 1rem;">{period["label"]}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Dose controls
-                    subcol1, subcol2, subcol3 = st.columns([1, 2, 1])
-                    
-                    # Decrease button
-                    with subcol1:
-                        button_disabled = current_dose <= 0
-                        if st.button(
-                            "−",
-                            key=f"dec_{medication.id}_{period['key']}",
-                            disabled=button_disabled,
-                            help="Decrease dose",
-                            use_container_width=True
-                        ):
-                            self.adjust_dose(medication.id, period["key"], False)
-                    
-                    # Dose value display
-                    with subcol2:
-                        st.markdown(f'<div class="dose-value">{current_dose}</div>', unsafe_allow_html=True)
-                    
-                    # Increase button  
-                    with subcol3:
-                        max_dose = self.dose_options[-1]
-                        button_disabled = current_dose >= max_dose
-                        if st.button(
-                            "+",
-                            key=f"inc_{medication.id}_{period['key']}",
-                            disabled=button_disabled,
-                            help="Increase dose",
-                            use_container_width=True
-                        ):
-                            self.adjust_dose(medication.id, period["key"], True)
-            
-            # Schedule summary
-            total_doses = medication.morning + medication.noon + medication.night
-            if total_doses > 0:
-                schedule_parts = []
-                if medication.morning > 0:
-                    schedule_parts.append(f"{medication.morning}")
-                if medication.noon > 0:
-                    schedule_parts.append(f"{medication.noon}")
-                if medication.night > 0:
-                    schedule_parts.append(f"{medication.night}")
-
-                st.markdown(f"""
-                <div style="background: rgba(59, 130, 246, 0.2); border-radius: 8px; padding: 1rem; margin-top: 1rem;">
-                    <div style="font-weight: 500; color: #3b82f6; margin-bottom: 0.5rem;">Schedule Summary:</div>
-                    <div style="color: rgba(255, 255, 255, 0.8);">{" ".join(schedule_parts)}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
+            self.render_medication_row(i, medication.id)
         
         # Add medication button
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            if st.button("➕ Add Another Medication", use_container_width=True, key="add_medication"):
-                new_id = str(len(st.session_state.medications) + 1)
-                st.session_state.medications.append(
-                    Medication(id=new_id, name="", morning=0, noon=0, night=0)
-                )
-                st.rerun()
+            st.button("➕ Add Another Medication", use_container_width=True, key="add_medication", on_click=self.add_medication)
         
         # Validation and navigation
         valid_medications = [
@@ -937,27 +500,225 @@ class MedicalAdvisorApp:
         
         st.markdown('</div>', unsafe_allow_html=True)
     
+    @st.fragment
+    def render_medication_row(self, i: int, medication_id: str):
+        """Render one medication card.
+
+        Runs as a fragment, so editing a name reruns only this card rather
+        than the whole page; deletions and dose changes still rerun the app.
+        """
+        medication = next(
+            (med for med in st.session_state.medications if med.id == medication_id), None
+        )
+        if medication is None:
+            return
+        
+        st.markdown(f'<div class="medication-item">', unsafe_allow_html=True)
+        
+        # Medication header
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.markdown(f"<h4>Medication {i + 1}</h4>", unsafe_allow_html=True)
+        
+        with col2:
+            if len(st.session_state.medications) > 1:
+                if st.button("🗑️", key=f"delete_{medication.id}", help="Remove medication"):
+                    st.session_state.medications = [
+                        med for med in st.session_state.medications if med.id != medication.id
+                    ]
+                    if medication.id in st.session_state.suggestions:
+                        del st.session_state.suggestions[medication.id]
+                    st.rerun()
+        
+        # Medication name input with search
+        st.markdown("""
+        <div style="margin: 1rem 0;">
+            <label style="font-weight: 500; margin-bottom: 0.5rem; display: block;">Medication Name</label>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Create a text input for medication name
+        st.text_input(
+            "Medication Name",
+            value=medication.name,
+            key=f"med_name_{medication.id}",
+            placeholder="Type medication name...",
+            label_visibility="collapsed",
+            on_change=self.update_medication_name,
+            args=(medication.id,)
+        )
+        
+        # Show suggestions if available
+        if medication.id in st.session_state.suggestions and st.session_state.suggestions[medication.id]:
+            st.markdown("**Suggestions:**")
+            cols = st.columns(min(3, len(st.session_state.suggestions[medication.id])))
+            for idx, suggestion in enumerate(st.session_state.suggestions[medication.id][:3]):
+                with cols[idx]:
+                    st.button(
+                        f"✓ {suggestion}",
+                        key=f"suggestion_{medication.id}_{suggestion}_{idx}",
+                        help="Click to select this medication",
+                        use_container_width=True,
+                        on_click=self.select_suggestion,
+                        args=(medication.id, suggestion)
+                    )
+        
+        # Dosage schedule
+        st.markdown("""
+        <div style="margin: 1.5rem 0;">
+            <label style="font-weight: 500; margin-bottom: 1rem; display: block;">Daily Schedule</label>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        cols = st.columns(len(DOSE_PERIODS))
+        for col, (period, label, icon) in zip(cols, DOSE_PERIODS):
+            with col:
+                current_dose = getattr(medication, period)
+                
+                st.markdown(f"""
+                <div class="dosage-item">
+                    <div style="font-size: 1.5rem; margin-bottom: 0.5rem;">{icon}</div>
+                    <div style="font-weight: 500; margin-bottom: 1rem;">{label}</div>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                # Dose controls
+                subcol1, subcol2, subcol3 = st.columns([1, 2, 1])
+                
+                # Decrease button
+                with subcol1:
+                    button_disabled = current_dose <= 0
+                    if st.button(
+                        "−",
+                        key=f"dec_{medication.id}_{period}",
+                        disabled=button_disabled,
+                        help="Decrease dose",
+                        use_container_width=True
+                    ):
+                        self.adjust_dose(medication.id, period, False)
+                
+                # Dose value display
+                with subcol2:
+                    st.markdown(f'<div class="dose-value">{current_dose}</div>', unsafe_allow_html=True)
+                
+                # Increase button  
+                with subcol3:
+                    max_dose = DOSE_OPTIONS[-1]
+                    button_disabled = current_dose >= max_dose
+                    if st.button(
+                        "+",
+                        key=f"inc_{medication.id}_{period}",
+                        disabled=button_disabled,
+                        help="Increase dose",
+                        use_container_width=True
+                    ):
+                        self.adjust_dose(medication.id, period, True)
+        
+        # Schedule summary
+        schedule_parts = [
+            f"{getattr(medication, period)}"
+            for period, _, _ in DOSE_PERIODS
+            if getattr(medication, period) > 0
+        ]
+        if schedule_parts:
+            st.markdown(f"""
+            <div style="background: rgba(59, 130, 246, 0.2); border-radius: 8px; padding: 1rem; margin-top: 1rem;">
+                <div style="font-weight: 500; color: #3b82f6; margin-bottom: 0.5rem;">Schedule Summary:</div>
+                <div style="color: rgba(255, 255, 255, 0.8);">{" ".join(schedule_parts)}</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+        
+        # The validation messages below the cards only change when a name is
+        # filled in or cleared; refresh the page once every widget in this
+        # card has been handled so no click is dropped
+        if st.session_state.pop(f"refresh_page_{medication.id}", False):
+            st.rerun()
+    
+    def update_medication_name(self, medication_id: str):
+        """Store a typed medication name and search for matching drugs.
+
+        Runs as the name input's on_change callback, before the rerun the
+        edit triggers, so the card renders with the new name and suggestions.
+        """
+        med_name = st.session_state[f"med_name_{medication_id}"]
+        for j, med in enumerate(st.session_state.medications):
+            if med.id == medication_id:
+                st.session_state.medications[j] = Medication(
+                    id=med.id,
+                    name=med_name,
+                    morning=med.morning,
+                    noon=med.noon,
+                    night=med.night
+                )
+                # A fragment callback cannot rerun the whole app; flag the
+                # card to do it at the end of its run
+                if bool(med_name.strip()) != bool(med.name.strip()):
+                    st.session_state[f"refresh_page_{medication_id}"] = True
+                break
+        
+        # Trigger search for suggestions
+        if len(med_name.strip()) >= MIN_DRUG_QUERY_LENGTH:
+            self.search_drugs(med_name, medication_id)
+    
+    def select_suggestion(self, medication_id: str, suggestion: str):
+        """Use a suggested drug name for a medication.
+
+        Runs as a button callback, before the rerun the click triggers, so
+        the card renders the new name without a second rerun.
+        """
+        # Update medication name
+        for j, med in enumerate(st.session_state.medications):
+            if med.id == medication_id:
+                st.session_state.medications[j] = Medication(
+                    id=med.id,
+                    name=suggestion,
+                    morning=med.morning,
+                    noon=med.noon,
+                    night=med.night
+                )
+                break
+        
+        # Drop the typed text so the input is rebuilt from the new name
+        st.session_state.pop(f"med_name_{medication_id}", None)
+        
+        # Clear suggestions
+        st.session_state.suggestions.pop(medication_id, None)
+    
+    def add_medication(self):
+        """Append an empty medication row (button callback)"""
+        new_id = str(len(st.session_state.medications) + 1)
+        st.session_state.medications.append(
+            Medication(id=new_id, name="", morning=0, noon=0, night=0)
+        )
+    
     def search_drugs(self, query: str, medication_id: str):
         """Search for drug suggestions"""
-        if len(query) < 2:
+        # Each rerun comes from a single widget change, so at most one row
+        # reaches this lookup per rerun and there is nothing to fan out
+        # concurrently; rows with unchanged names never call it
+        # The API matches case-insensitively on the stripped query
+        query = query.strip().lower()
+        if len(query) < MIN_DRUG_QUERY_LENGTH:
             if medication_id in st.session_state.suggestions:
                 del st.session_state.suggestions[medication_id]
+            st.session_state.suggestion_queries.pop(medication_id, None)
+            return
+        
+        # Reruns with an unchanged query keep the suggestions already shown
+        if (
+            medication_id in st.session_state.suggestions
+            and st.session_state.suggestion_queries.get(medication_id) == query
+        ):
             return
         
         st.session_state.loading_suggestions[medication_id] = True
         
         try:
-            response = requests.get(
-                f"{self.api_base_url}/search_drugs",
-                params={"query": query, "limit": 5},
-                timeout=10
-            )
-            if response.ok:
-                data = response.json()
-                st.session_state.suggestions[medication_id] = data.get("results", [])
-            else:
-                st.session_state.suggestions[medication_id] = []
-        except:
+            st.session_state.suggestions[medication_id] = fetch_drug_suggestions(self.api_base_url, query)
+            st.session_state.suggestion_queries[medication_id] = query
+        except (requests.exceptions.RequestException, ValueError):
             st.session_state.suggestions[medication_id] = []
         
         st.session_state.loading_suggestions[medication_id] = False
@@ -967,15 +728,12 @@ class MedicalAdvisorApp:
         for i, med in enumerate(st.session_state.medications):
             if med.id == med_id:
                 current_dose = getattr(med, period)
-                try:
-                    current_index = self.dose_options.index(current_dose)
-                except ValueError:
-                    current_index = 0
+                current_index = DOSE_INDEX.get(current_dose, 0)
                 
-                if increment and current_index < len(self.dose_options) - 1:
-                    new_dose = self.dose_options[current_index + 1]
+                if increment and current_index < len(DOSE_OPTIONS) - 1:
+                    new_dose = DOSE_OPTIONS[current_index + 1]
                 elif not increment and current_index > 0:
-                    new_dose = self.dose_options[current_index - 1]
+                    new_dose = DOSE_OPTIONS[current_index - 1]
                 else:
                     return
                 
@@ -1256,7 +1014,7 @@ class MedicalAdvisorApp:
         """Process the consultation request - called when loading is true"""
         try:
             # First check if API is available
-            health_response = requests.get(f"{self.api_base_url}/health", timeout=5)
+            health_response = get_http_session().get(f"{self.api_base_url}/health", timeout=(0.5, 2))
             if health_response.status_code != 200:
                 raise requests.exceptions.RequestException("API health check failed")
             
@@ -1383,21 +1141,58 @@ The API provides access to medical literature, drug databases, and AI analysis f
         return summary
     
     def call_advice_api(self) -> Dict:
-        """Call the backend API to get medication advice"""
-        url = f"{self.api_base_url}/advise"
-        
+        """Call the backend API to get medication advice, showing it as it streams in"""
         payload = {
             "meds": [med.name for med in st.session_state.medications],
-            "schedule": [f"{med.morning}+{med.noon}+{med.night}" for med in st.session_state.medications],
+            "schedule": [format_schedule(med) for med in st.session_state.medications],
             "age": st.session_state.patient_info.age,
             "gender": st.session_state.patient_info.gender
         }
         
-        # Increase timeout for first request as AI model needs time to load
-        response = requests.post(url, json=payload, timeout=120)
+        # Encoded once with orjson and shared by both endpoints
+        body = orjson.dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        session = get_http_session()
+        
+        # Increase timeout for first request as AI model needs time to load;
+        # while streaming it bounds the wait for each line, not the whole reply
+        with session.post(
+            f"{self.api_base_url}/advise/stream", data=body, headers=headers, stream=True, timeout=(5, 120)
+        ) as response:
+            if response.status_code != 404:
+                response.raise_for_status()
+                lines = response.iter_lines()
+                first_line = next(lines, None)
+                if first_line is None:
+                    raise requests.exceptions.RequestException("The advice stream was empty")
+                details = orjson.loads(first_line)["details"]
+                
+                # The stream ends with a "done" or "error" record; anything
+                # else means the advice was cut short and must not be kept
+                final_record = {}
+                
+                def advice_chunks():
+                    for line in lines:
+                        if not line:
+                            continue
+                        record = orjson.loads(line)
+                        if "delta" not in record:
+                            final_record.update(record)
+                            return
+                        yield record["delta"]
+                
+                advice = st.write_stream(advice_chunks())
+                if "error" in final_record:
+                    raise requests.exceptions.RequestException(final_record["error"])
+                if not final_record.get("done"):
+                    raise requests.exceptions.RequestException("The advice stream ended before the advice was complete")
+                return {"advice": advice, **details}
+        
+        # Older API servers only offer the blocking endpoint
+        response = session.post(f"{self.api_base_url}/advise", data=body, headers=headers, timeout=120)
         response.raise_for_status()
         
-        return response.json()
+        return orjson.loads(response.content)
     
     def reset_flow(self):
         """Reset the entire flow to start over"""
@@ -1407,6 +1202,7 @@ The API provides access to medical literature, drug databases, and AI analysis f
         st.session_state.chat_messages = []
         st.session_state.show_chat = False
         st.session_state.advice_result = None
+        st.session_state.advice_report = None
         st.session_state.is_loading = False
         st.session_state.suggestions = {}
         st.session_state.loading_suggestions = {}
@@ -1528,15 +1324,7 @@ The API provides access to medical literature, drug databases, and AI analysis f
                 if med.name.strip() and (med.morning > 0 or med.noon > 0 or med.night > 0):
                     story.append(Paragraph(f"{i}. {med.name}", subheading_style))
                     
-                    schedule_parts = []
-                    if med.morning > 0:
-                        schedule_parts.append(f"Morning: {med.morning}")
-                    if med.noon > 0:
-                        schedule_parts.append(f"Noon: {med.noon}")
-                    if med.night > 0:
-                        schedule_parts.append(f"Night: {med.night}")
-                    
-                    schedule_text = " | ".join(schedule_parts)
+                    schedule_text = format_schedule_detail(med)
                     total_daily = med.morning + med.noon + med.night
                     
                     story.append(Paragraph(f"Daily Schedule: {schedule_text}", normal_style))
@@ -1726,21 +1514,22 @@ The API provides access to medical literature, drug databases, and AI analysis f
     def download_advice(self):
         """Download the advice as text or PDF file"""
         if st.session_state.advice_result:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # This renders on every rerun of the chat page, so the reports are
+            # built once per advice result and reused until the next one
+            report = st.session_state.advice_report
+            if report is None or report["advice_result"] is not st.session_state.advice_result:
+                report = self.build_advice_report()
+                st.session_state.advice_report = report
+            timestamp = report["timestamp"]
             
             # Create two columns for download options
             col1, col2 = st.columns(2)
             
             with col1:
                 # Text download
-                advice_text = self.clean_and_format_content(st.session_state.advice_result["advice"])
-                
-                # Create comprehensive text report
-                text_report = self.create_text_report(advice_text, timestamp)
-                
                 st.download_button(
                     label="📄 Download as Text",
-                    data=text_report,
+                    data=report["text"],
                     file_name=f"medication_advice_{timestamp}.txt",
                     mime="text/plain",
                     use_container_width=True
@@ -1748,20 +1537,39 @@ The API provides access to medical literature, drug databases, and AI analysis f
             
             with col2:
                 # PDF download
-                try:
-                    pdf_data = self.generate_pdf_report()
-                    if pdf_data:
-                        st.download_button(
-                            label="📋 Download as PDF",
-                            data=pdf_data,
-                            file_name=f"medication_advice_{timestamp}.pdf",
-                            mime="application/pdf",
-                            use_container_width=True
-                        )
-                    else:
-                        st.error("Failed to generate PDF")
-                except Exception as e:
-                    st.error(f"PDF generation error: {str(e)}")
+                if report["pdf_error"]:
+                    st.error(f"PDF generation error: {report['pdf_error']}")
+                elif report["pdf"]:
+                    st.download_button(
+                        label="📋 Download as PDF",
+                        data=report["pdf"],
+                        file_name=f"medication_advice_{timestamp}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+                else:
+                    st.error("Failed to generate PDF")
+    
+    def build_advice_report(self) -> Dict:
+        """Build the text and PDF reports for the current advice result"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        # Create comprehensive text report
+        advice_text = self.clean_and_format_content(st.session_state.advice_result["advice"])
+        report = {
+            "advice_result": st.session_state.advice_result,
+            "timestamp": timestamp,
+            "text": self.create_text_report(advice_text, timestamp),
+            "pdf": None,
+            "pdf_error": None
+        }
+        
+        try:
+            report["pdf"] = self.generate_pdf_report()
+        except Exception as e:
+            report["pdf_error"] = str(e)
+        
+        return report
     
     def create_text_report(self, advice_content: str, timestamp: str) -> str:
         """Create a comprehensive text report"""
@@ -1794,15 +1602,7 @@ The API provides access to medical literature, drug databases, and AI analysis f
                 if med.name.strip() and (med.morning > 0 or med.noon > 0 or med.night > 0):
                     report_lines.append(f"{i}. {med.name}")
                     
-                    schedule_parts = []
-                    if med.morning > 0:
-                        schedule_parts.append(f"Morning: {med.morning}")
-                    if med.noon > 0:
-                        schedule_parts.append(f"Noon: {med.noon}")
-                    if med.night > 0:
-                        schedule_parts.append(f"Night: {med.night}")
-                    
-                    schedule_text = " | ".join(schedule_parts)
+                    schedule_text = format_schedule_detail(med)
                     total_daily = med.morning + med.noon + med.night
                     
                     report_lines.append(f"   Daily Schedule: {schedule_text}")